@@ -0,0 +1,392 @@
+"""
+Load benchmark of the API.
+
+Run from the project root:  python -m benchmarks.load [options]
+
+The benchmark seeds the in-memory storage of memory_store.py with --users users and --blogs blogs,
+tagged from --tags tags with a Zipf distribution (a few popular tags, a long tail), then replays
+--requests requests from --concurrency concurrent clients against main.app in-process, through
+httpx's ASGI transport, after --warmup untimed ones. There is no network and no MongoDB, and the same --seed gives the same
+dataset and the same request sequence.
+
+The request mix (MIX) covers the list page, deep pages, single blogs, related blogs, the most read
+blogs, tag feeds, dashboards, search, logins and blog writes. The report has the throughput and p50/p95/p99 latency of every
+scenario. --save writes it as JSON and --compare prints the change against a saved run; with
+--max-regression the run fails when a p95 got slower by more than that many percent.
+"""
+
+import os
+
+# the benchmark never talks to a real database, whatever the environment says
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+import httpx
+from database import blog_collection, users_collection
+from identity import ACCESS_TOKEN_MINUTES
+from main import app
+from migrations.rebuild_feeds import rebuild_feeds
+from migrations.rebuild_related import rebuild_related
+from migrations.rebuild_tag_stats import rebuild_tag_stats
+from models.blogs_model import BlogRequest
+from routers.auth import create_access_token
+from routers.blogs import new_blog
+from security import bcrypt_context
+
+PASSWORD = "Benchmark1!"
+WORDS = (
+    "cloud python mongo cache index query latency design async feed tag search "
+    "deploy scale shard replica write read token api route page cursor"
+).split()
+
+# MIX is the share of every scenario in the replayed requests
+MIX = {
+    "list_page": 25,
+    "deep_page": 8,
+    "cursor_page": 7,
+    "read_blog": 20,
+    "related": 6,
+    "popular": 3,
+    "tag_feed": 12,
+    "dashboard": 12,
+    "search": 6,
+    "create_blog": 8,
+    "login": 2,
+}
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+# Dataset is the seeded data the scenarios pick their parameters from
+class Dataset:
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.tags = [f"tag{n}" for n in range(args.tags)]
+        # Zipf weights, tag n is 1/(n+1) as popular as the first
+        self.tag_weights = [1 / (n + 1) for n in range(args.tags)]
+        self.users = []
+        self.blog_ids = []
+        self.page_size = args.page_size
+        self.blogs = args.blogs
+
+    def pick_tags(self, count: int) -> list:
+        return list(set(self.rng.choices(self.tags, weights=self.tag_weights, k=count)))
+
+    async def seed(self, users: int, blogs: int):
+        hashed = bcrypt_context.hash(PASSWORD)
+        user_docs = [
+            {
+                "username": f"user{n}",
+                "email": f"user{n}@example.com",
+                "first_name": "Bench",
+                "last_name": f"User{n}",
+                "password": hashed,
+                "role": "user",
+                "tags": self.pick_tags(3),
+            }
+            for n in range(users)
+        ]
+        await users_collection.insert_many(user_docs)
+        for user in user_docs:
+            token = create_access_token(
+                user["username"],
+                str(user["_id"]),
+                user["role"],
+                timedelta(minutes=ACCESS_TOKEN_MINUTES),
+            )
+            self.users.append((user["username"], {"Authorization": f"Bearer {token}"}))
+
+        start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=30)
+        blog_docs = []
+        for n in range(blogs):
+            owner = self.rng.choice(user_docs)
+            created = start + timedelta(seconds=self.rng.randrange(30 * 24 * 3600))
+            request = BlogRequest(
+                title=_text(self.rng, 4),
+                body=_text(self.rng, 10),
+                tags=self.pick_tags(self.rng.randint(1, 3)),
+            )
+            blog_docs.append(
+                new_blog(
+                    request,
+                    {"id": str(owner["_id"]), "username": owner["username"]},
+                    created,
+                )
+            )
+        for chunk in range(0, len(blog_docs), 1000):
+            await blog_collection.insert_many(blog_docs[chunk : chunk + 1000])
+        self.blog_ids = [str(blog["_id"]) for blog in blog_docs]
+
+        await rebuild_tag_stats()
+        await rebuild_feeds()
+        await rebuild_related()
+
+
+# every scenario sends one request and returns the response
+async def list_page(client, data, rng):
+    return await client.get("/api/blogs/", params={"limit": data.page_size})
+
+
+async def deep_page(client, data, rng):
+    pages = max(data.blogs // data.page_size, 1)
+    page = rng.randint(max(pages // 2, 1), pages)
+    return await client.get(
+        "/api/blogs/", params={"limit": data.page_size, "page": page}
+    )
+
+
+async def cursor_page(client, data, rng):
+    response = await client.get("/api/blogs/", params={"limit": data.page_size})
+    cursor = response.headers.get("x-next-cursor")
+    for _ in range(rng.randint(1, 5)):
+        if cursor is None:
+            break
+        response = await client.get(
+            "/api/blogs/", params={"limit": data.page_size, "cursor": cursor}
+        )
+        cursor = response.headers.get("x-next-cursor")
+    return response
+
+
+async def read_blog(client, data, rng):
+    return await client.get(f"/api/blogs/{rng.choice(data.blog_ids)}")
+
+
+async def related(client, data, rng):
+    return await client.get(f"/api/blogs/{rng.choice(data.blog_ids)}/related")
+
+
+async def popular(client, data, rng):
+    return await client.get("/api/blogs/popular", params={"limit": data.page_size})
+
+
+async def tag_feed(client, data, rng):
+    tag = rng.choices(data.tags, weights=data.tag_weights)[0]
+    return await client.get(
+        f"/api/dashboard/blogs/{tag}", params={"limit": data.page_size}
+    )
+
+
+async def dashboard(client, data, rng):
+    _, headers = rng.choice(data.users)
+    return await client.get(
+        "/api/dashboard/blogs", params={"limit": data.page_size}, headers=headers
+    )
+
+
+async def search(client, data, rng):
+    return await client.get(
+        "/api/blogs/search", params={"q": _text(rng, 2), "limit": data.page_size}
+    )
+
+
+async def create_blog(client, data, rng):
+    _, headers = rng.choice(data.users)
+    blog = {"title": _text(rng, 4), "body": _text(rng, 10), "tags": data.pick_tags(2)}
+    return await client.post("/api/blogs/", json=blog, headers=headers)
+
+
+async def login(client, data, rng):
+    username, _ = rng.choice(data.users)
+    return await client.post(
+        "/api/auth/login", data={"username": username, "password": PASSWORD}
+    )
+
+
+SCENARIOS = {
+    "list_page": list_page,
+    "deep_page": deep_page,
+    "cursor_page": cursor_page,
+    "read_blog": read_blog,
+    "related": related,
+    "popular": popular,
+    "tag_feed": tag_feed,
+    "dashboard": dashboard,
+    "search": search,
+    "create_blog": create_blog,
+    "login": login,
+}
+
+
+# replay will send requests requests of the mix from concurrency clients and time every one of them
+async def replay(client, data, args, requests: int, seed: int) -> tuple:
+    latencies = {name: [] for name in MIX}
+    errors = {name: 0 for name in MIX}
+    plan_rng = random.Random(seed)
+    plan = plan_rng.choices(list(MIX), weights=list(MIX.values()), k=requests)
+    position = 0
+
+    async def worker(number: int):
+        nonlocal position
+        rng = random.Random(seed * 1000 + number)
+        while position < len(plan):
+            name = plan[position]
+            position += 1
+            start = time.perf_counter()
+            response = await SCENARIOS[name](client, data, rng)
+            latencies[name].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def report(latencies: dict, errors: dict, elapsed: float, args) -> dict:
+    results = {}
+    for name, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        results[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "throughput": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "users",
+                "blogs",
+                "tags",
+                "requests",
+                "warmup",
+                "concurrency",
+                "page_size",
+                "seed",
+            )
+        },
+        "total": {
+            "requests": total,
+            "seconds": round(elapsed, 3),
+            "throughput": round(total / elapsed, 2),
+        },
+        "scenarios": results,
+    }
+
+
+def print_report(result: dict):
+    print(
+        f"{result['total']['requests']} requests in {result['total']['seconds']}s, "
+        f"{result['total']['throughput']} req/s"
+    )
+    print(
+        f"{'scenario':<12} {'count':>6} {'errors':>6} {'req/s':>8} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for name, row in result["scenarios"].items():
+        print(
+            f"{name:<12} {row['count']:>6} {row['errors']:>6} {row['throughput']:>8} "
+            f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+        )
+
+
+# compare will print the change of every percentile against the baseline
+# and return the scenarios whose p95 got slower by more than max_regression percent
+def compare(result: dict, baseline: dict, max_regression=None) -> list:
+    if baseline.get("config") != result["config"]:
+        print("warning: the baseline was recorded with a different configuration")
+
+    regressions = []
+    print(f"{'scenario':<12} {'p50':>9} {'p95':>9} {'p99':>9}  (change vs baseline)")
+    for name, row in result["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        changes = {}
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            changes[key] = (
+                (row[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            )
+        print(
+            f"{name:<12} {changes['p50_ms']:>+8.1f}% {changes['p95_ms']:>+8.1f}% "
+            f"{changes['p99_ms']:>+8.1f}%"
+        )
+        if max_regression is not None and changes["p95_ms"] > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--blogs", type=int, default=5000)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write the report as JSON to this file")
+    parser.add_argument("--compare", help="a report saved with --save to compare with")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="fail when a p95 is this many percent slower than in --compare",
+    )
+    return parser.parse_args(argv)
+
+
+async def run(args) -> dict:
+    async with app.router.lifespan_context(app):
+        data = Dataset(args)
+        await data.seed(args.users, args.blogs)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark"
+        ) as client:
+            # the warmup fills the caches and loads the search index before anything is timed
+            await replay(client, data, args, args.warmup, args.seed + 2)
+            latencies, errors, elapsed = await replay(
+                client, data, args, args.requests, args.seed + 1
+            )
+    return report(latencies, errors, elapsed, args)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    print_report(result)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.max_regression)
+        if regressions:
+            print(
+                f"p95 regressions over {args.max_regression}%: {', '.join(regressions)}"
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+
+# MISSING is returned by LRUCache.get when the key is not cached, so that None can be cached as a value
+MISSING = object()
+
+
+# LRUCache is an in-process cache with a size bound, least recently used eviction and a time to live
+# it is only touched from the event loop, so it does not need a lock
+# on_evict is called with the key and value of every entry dropped to stay within maxsize
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: float, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    # get will return the cached value or MISSING if the key is not cached or has expired
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    # set will cache value for ttl seconds, or until expires_at (a time.monotonic() value) if given
+    def set(self, key, value, expires_at: float = None):
+        if expires_at is None:
+            expires_at = time.monotonic() + self.ttl
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted, (evicted_value, _) = self._data.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted, evicted_value)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,4 +1,7 @@
-from pymongo.mongo_client import MongoClient
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 from dotenv import load_dotenv
 import os
 
@@ -6,10 +9,200 @@ load_dotenv()
 # the uri is the connection string to the database, get it from the environment variables
 uri = os.getenv("DATABASE_URL")
 
-# Create a new client and connect to the server
-client = MongoClient(uri)
+# pymongo is a blocking driver, so every call runs on this bounded thread pool instead of the event loop
+# the pool size caps the number of concurrent database calls a worker can have in flight
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "32"))
+db_executor = ThreadPoolExecutor(
+    max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="mongo"
+)
 
-db = client.blog_db
+# connection pool settings, maxPoolSize should be at least DB_EXECUTOR_WORKERS so that no call waits for a socket
+# timeouts are in milliseconds, an empty value keeps the pymongo default
+CLIENT_OPTIONS = {
+    "maxPoolSize": os.getenv("MONGO_MAX_POOL_SIZE", "100"),
+    "minPoolSize": os.getenv("MONGO_MIN_POOL_SIZE", "0"),
+    "maxIdleTimeMS": os.getenv("MONGO_MAX_IDLE_TIME_MS", ""),
+    "connectTimeoutMS": os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"),
+    "socketTimeoutMS": os.getenv("MONGO_SOCKET_TIMEOUT_MS", ""),
+    "serverSelectionTimeoutMS": os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"),
+    "waitQueueTimeoutMS": os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", ""),
+}
 
-blog_collection = db["blogs"]
-users_collection = db["users"]
+# READ_PREFERENCE is used by the collections of read-only routes that are not cached, e.g. 'secondaryPreferred'
+# those reads may lag behind the latest writes by the replication delay
+READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+
+DATABASE_NAME = "blog_db"
+
+# STORAGE_BACKEND is 'mongo' (default) or 'memory', the in-process stand-in of memory_store.py
+# the memory storage needs no server, it is meant for tests and benchmarks and loses everything on exit
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+
+_client = None
+
+
+# get_client will create the client on first use, pymongo is only imported then
+# the lifespan in main.py creates it at startup, scripts and tests without a lifespan get it here
+def get_client():
+    global _client
+    if _client is None:
+        from pymongo import MongoClient
+        from metrics import CommandTimer
+
+        options = {key: int(value) for key, value in CLIENT_OPTIONS.items() if value}
+        # dates are read back as timezone aware UTC datetimes, like the ones the app writes
+        _client = MongoClient(
+            uri, tz_aware=True, event_listeners=[CommandTimer()], **options
+        )
+    return _client
+
+
+def close_client():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+# ping will check that the server answers, it raises once serverSelectionTimeoutMS has passed
+async def ping():
+    if STORAGE_BACKEND == "memory":
+        return
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(db_executor, partial(get_client().admin.command, "ping"))
+
+
+# AsyncCollection wraps a pymongo collection and exposes awaitable versions of the calls the routers use
+# its methods are the storage interface of the app, memory_store.MemoryCollection implements the same
+# the pymongo collection is resolved on first use, so importing this module never connects
+class AsyncCollection:
+    def __init__(self, name: str, read_preference: str = "primary"):
+        self.name = name
+        self.read_preference = read_preference
+        self._collection = None
+        self._client = None
+
+    @property
+    def collection(self):
+        client = get_client()
+        if self._collection is None or self._client is not client:
+            from pymongo.read_preferences import (
+                make_read_preference,
+                read_pref_mode_from_name,
+            )
+
+            preference = make_read_preference(
+                read_pref_mode_from_name(self.read_preference), None
+            )
+            self._collection = client[DATABASE_NAME].get_collection(
+                self.name, read_preference=preference
+            )
+            self._client = client
+        return self._collection
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(db_executor, partial(fn, *args, **kwargs))
+
+    # find returns a list instead of a cursor, since iterating a cursor is what talks to the server
+    async def find(self, filter=None, projection=None, sort=None, skip=0, limit=0):
+        def query():
+            cursor = self.collection.find(filter or {}, projection)
+            if sort:
+                cursor = cursor.sort(sort)
+            return list(cursor.skip(skip).limit(limit))
+
+        return await self._run(query)
+
+    # iter_batches will iterate a cursor batch_size documents at a time, holding one batch in memory
+    async def iter_batches(self, filter=None, projection=None, batch_size=500):
+        cursor = self.collection.find(filter or {}, projection, batch_size=batch_size)
+        try:
+            while True:
+                batch = await self._run(lambda: list(islice(cursor, batch_size)))
+                if not batch:
+                    return
+                yield batch
+        finally:
+            # closing a cursor the server still holds is a killCursors round trip
+            await self._run(cursor.close)
+
+    async def find_one(self, *args, **kwargs):
+        return await self._run(self.collection.find_one, *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._run(self.collection.insert_one, *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self._run(self.collection.insert_many, *args, **kwargs)
+
+    async def replace_one(self, *args, **kwargs):
+        return await self._run(self.collection.replace_one, *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self._run(self.collection.update_one, *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await self._run(self.collection.update_many, *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await self._run(self.collection.bulk_write, *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self._run(self.collection.delete_one, *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self._run(self.collection.delete_many, *args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs):
+        return await self._run(self.collection.count_documents, *args, **kwargs)
+
+    async def distinct(self, *args, **kwargs):
+        return await self._run(self.collection.distinct, *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await self._run(self.collection.find_one_and_update, *args, **kwargs)
+
+    async def find_one_and_replace(self, *args, **kwargs):
+        return await self._run(self.collection.find_one_and_replace, *args, **kwargs)
+
+    async def find_one_and_delete(self, *args, **kwargs):
+        return await self._run(self.collection.find_one_and_delete, *args, **kwargs)
+
+    async def aggregate(self, pipeline, **kwargs):
+        return await self._run(
+            lambda: list(self.collection.aggregate(pipeline, **kwargs))
+        )
+
+    async def create_index(self, *args, **kwargs):
+        return await self._run(self.collection.create_index, *args, **kwargs)
+
+    async def index_information(self):
+        return await self._run(self.collection.index_information)
+
+
+_memory_collections = {}
+
+
+# collection will return the named collection of the configured STORAGE_BACKEND
+# memory collections are shared by name, there are no secondaries to read from
+def collection(name: str, read_preference: str = "primary"):
+    if STORAGE_BACKEND == "memory":
+        from memory_store import MemoryCollection
+
+        return _memory_collections.setdefault(name, MemoryCollection(name))
+    return AsyncCollection(name, read_preference)
+
+
+blog_collection = collection("blogs")
+users_collection = collection("users")
+tag_feeds_collection = collection("tag_feeds")
+user_feeds_collection = collection("user_feeds")
+tag_stats_collection = collection("tag_stats")
+jobs_collection = collection("jobs")
+related_collection = collection("related_blogs")
+
+# blog_reads is the blogs collection for read-only routes, it reads with READ_PREFERENCE
+# routes served through the response cache read from the primary, a response computed from a
+# lagging secondary would otherwise be served for the whole RESPONSE_CACHE_TTL after the write
+blog_reads = collection("blogs", READ_PREFERENCE)
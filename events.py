@@ -0,0 +1,81 @@
+"""
+Hooks the routers call after they changed blogs or users.
+
+Everything that is derived from the blogs and users collections (cached responses, feeds,
+cached identities, ...) is kept up to date from here, so that a new derived structure only
+has to be wired up once.
+"""
+
+import feeds
+import related
+import tag_stats
+from identity import forget_user_document, revoke_user
+from response_cache import response_cache
+from search import search_backend
+
+
+# blog_created is called with the inserted blog document, including its _id
+async def blog_created(blog):
+    await feeds.add_blog(blog)
+    await search_backend.add(blog)
+    await tag_stats.blogs_added([blog])
+    await related.add_blog(blog)
+    await response_cache.invalidate()
+
+
+# blogs_created is blog_created for the blogs of a bulk insert
+async def blogs_created(blogs):
+    await feeds.add_blogs(blogs)
+    for blog in blogs:
+        await search_backend.add(blog)
+    await tag_stats.blogs_added(blogs)
+    await related.add_blogs(blogs)
+    await response_cache.invalidate()
+
+
+# blog_updated is called with the blog document before and after the update
+async def blog_updated(before, after):
+    await feeds.update_blog(before, after)
+    await search_backend.add(after)
+    await tag_stats.blog_updated(before, after)
+    await related.update_blog(before, after)
+    await response_cache.invalidate()
+
+
+# blog_deleted is called with the deleted blog document
+async def blog_deleted(blog):
+    await feeds.remove_blog(blog["_id"])
+    await search_backend.remove(blog["_id"])
+    await tag_stats.blogs_removed([blog])
+    await related.remove_blogs([blog["_id"]])
+    await response_cache.invalidate()
+
+
+# blogs_deleted is blog_deleted for a batch of deleted blogs, see jobs.py
+async def blogs_deleted(blogs):
+    await feeds.remove_blogs([blog["_id"] for blog in blogs])
+    for blog in blogs:
+        await search_backend.remove(blog["_id"])
+    await tag_stats.blogs_removed(blogs)
+    await related.remove_blogs([blog["_id"] for blog in blogs])
+    await response_cache.invalidate()
+
+
+# blogs_tombstoned is called with the blogs of a deleted user after they were marked as DELETED_OWNER
+async def blogs_tombstoned(blogs):
+    for blog in blogs:
+        await search_backend.add(blog)
+    await response_cache.invalidate()
+
+
+# user_tags_changed is called with the tags a user follows after they changed
+async def user_tags_changed(user_id: str, tags: list):
+    forget_user_document(user_id)
+    await feeds.rebuild_user_feed(user_id, tags)
+
+
+# user_deleted is called with the deleted user document
+async def user_deleted(user):
+    revoke_user(str(user["_id"]))
+    await feeds.delete_user_feed(str(user["_id"]))
+    await response_cache.invalidate()
@@ -0,0 +1,230 @@
+"""
+Materialized dashboard feeds.
+
+Every tag has a timeline in tag_feeds and every user that read their dashboard has a timeline in
+user_feeds, merged from the timelines of the tags they follow. A timeline is a capped array of
+{"blog_id", "created_at"} entries kept sorted newest first, so a dashboard page is a single
+bounded $slice read of one document.
+
+Timelines are kept up to date incrementally by events.py when blogs are created, updated or deleted
+and when a user's tags change. A timeline is always a correct prefix of the full result, pages
+that run past its end fall back to the indexed query. Run migrations.rebuild_feeds once to build
+the tag timelines of blogs written before feeds existed.
+
+A timeline that ever dropped entries, because it grew past FEED_SIZE or was built from the newest
+FEED_SIZE blogs, is marked truncated and is only complete down to its last entry. Entries older
+than that are not pushed into it, and pulling entries from it only moves that bound up, so it stays
+a prefix however blogs are deleted or retagged. Timelines without the flag count as truncated.
+"""
+
+import heapq
+import os
+from pymongo import UpdateOne
+from bson import ObjectId
+from database import (
+    blog_collection,
+    tag_feeds_collection,
+    user_feeds_collection,
+    users_collection,
+)
+
+# FEED_SIZE is the number of newest blogs kept per timeline
+FEED_SIZE = int(os.getenv("FEED_SIZE", "1000"))
+
+# FEED_ORDER is the order of a timeline, the same as sorting blogs by (created_at, _id) descending
+FEED_ORDER = {"created_at": -1, "blog_id": -1}
+
+
+def _entry(blog) -> dict:
+    return {"blog_id": blog["_id"], "created_at": blog["created_at"]}
+
+
+def _position(entry) -> tuple:
+    return entry["created_at"], entry["blog_id"]
+
+
+def _push(entry) -> dict:
+    return {"$push": {"items": {"$each": [entry], "$sort": FEED_ORDER}}}
+
+
+# _accepts will select the timelines the entry can go into without leaving a gap behind it,
+# the complete ones and the truncated ones holding an entry older than it
+def _accepts(entry) -> dict:
+    older = {
+        "$or": [
+            {"created_at": {"$lt": entry["created_at"]}},
+            {"created_at": entry["created_at"], "blog_id": {"$lt": entry["blog_id"]}},
+        ]
+    }
+    return {"$or": [{"truncated": False}, {"items": {"$elemMatch": older}}]}
+
+
+# _trim will cut a timeline that grew past FEED_SIZE and mark it truncated in the same write
+def _trim() -> tuple:
+    return (
+        {f"items.{FEED_SIZE}": {"$exists": True}},
+        {
+            "$push": {"items": {"$each": [], "$slice": FEED_SIZE}},
+            "$set": {"truncated": True},
+        },
+    )
+
+
+# _tag_writes will return the ordered writes that create the timeline of the tag and push the entries
+def _tag_writes(tag: str, entries: list) -> list:
+    full, trim = _trim()
+    writes = [
+        UpdateOne(
+            {"_id": tag},
+            {"$setOnInsert": {"items": [], "truncated": False}},
+            upsert=True,
+        )
+    ]
+    writes.extend(
+        UpdateOne({"_id": tag, **_accepts(entry)}, _push(entry)) for entry in entries
+    )
+    writes.append(UpdateOne({"_id": tag, **full}, trim))
+    return writes
+
+
+# add_blog will insert the blog into the timelines of its tags and of every user following one of them
+async def add_blog(blog):
+    tags = list(set(blog["tags"]))
+    if not tags:
+        return
+
+    entry = _entry(blog)
+    await tag_feeds_collection.bulk_write(
+        [write for tag in tags for write in _tag_writes(tag, [entry])]
+    )
+
+    following = {"tags": {"$in": tags}}
+    full, trim = _trim()
+    await user_feeds_collection.update_many(
+        {**following, **_accepts(entry)}, _push(entry)
+    )
+    await user_feeds_collection.update_many({**following, **full}, trim)
+
+
+# add_blogs will insert many blogs at once, with one bulk_write for every tag timeline
+# the timelines of users following one of the tags are dropped and merged again when they are read
+async def add_blogs(blogs):
+    entries = {}
+    for blog in blogs:
+        for tag in set(blog["tags"]):
+            entries.setdefault(tag, []).append(_entry(blog))
+    if not entries:
+        return
+
+    await tag_feeds_collection.bulk_write(
+        [write for tag, items in entries.items() for write in _tag_writes(tag, items)]
+    )
+    await user_feeds_collection.delete_many({"tags": {"$in": list(entries)}})
+
+
+# remove_blog will take the blog out of every timeline that contains it
+async def remove_blog(blog_id):
+    pull = {"$pull": {"items": {"blog_id": blog_id}}}
+    await tag_feeds_collection.update_many({"items.blog_id": blog_id}, pull)
+    await user_feeds_collection.update_many({"items.blog_id": blog_id}, pull)
+
+
+# remove_blogs is remove_blog for many blogs, with one write per timeline collection
+async def remove_blogs(blog_ids: list):
+    if not blog_ids:
+        return
+    pull = {"$pull": {"items": {"blog_id": {"$in": blog_ids}}}}
+    await tag_feeds_collection.update_many({"items.blog_id": {"$in": blog_ids}}, pull)
+    await user_feeds_collection.update_many({"items.blog_id": {"$in": blog_ids}}, pull)
+
+
+# update_blog will move the blog between timelines when its tags changed
+# created_at never changes, so a blog whose tags are the same keeps its place
+async def update_blog(before, after):
+    if set(before["tags"]) != set(after["tags"]):
+        await remove_blog(after["_id"])
+        await add_blog(after)
+
+
+# rebuild_user_feed will merge the timelines of the tags the user follows into the user's timeline
+async def rebuild_user_feed(user_id: str, tags: list) -> list:
+    tag_feeds = await tag_feeds_collection.find({"_id": {"$in": list(tags)}})
+
+    # the merge is complete down to the highest bound of the truncated tag timelines,
+    # and covers nothing when one of them is empty
+    truncated = [
+        tag_feed["items"] for tag_feed in tag_feeds if tag_feed.get("truncated", True)
+    ]
+    items = []
+    seen = set()
+    if all(truncated):
+        bound = max((_position(feed[-1]) for feed in truncated), default=None)
+        merged = heapq.merge(
+            *(tag_feed["items"] for tag_feed in tag_feeds),
+            key=_position,
+            reverse=True,
+        )
+        for item in merged:
+            if bound is not None and _position(item) < bound:
+                break
+            if item["blog_id"] not in seen:
+                seen.add(item["blog_id"])
+                items.append(item)
+                if len(items) == FEED_SIZE:
+                    break
+
+    await user_feeds_collection.replace_one(
+        {"_id": user_id},
+        {
+            "tags": list(tags),
+            "items": items,
+            "truncated": bool(truncated) or len(items) == FEED_SIZE,
+        },
+        upsert=True,
+    )
+    return items
+
+
+async def delete_user_feed(user_id: str):
+    await user_feeds_collection.delete_one({"_id": user_id})
+
+
+async def _read(collection, key, skip: int, limit: int):
+    feed = await collection.find_one({"_id": key}, {"items": {"$slice": [skip, limit]}})
+    if feed is None:
+        return None
+    return [item["blog_id"] for item in feed["items"]]
+
+
+# read_user_feed will return the blog ids of one page of the user's dashboard, newest first
+# None means the page is not fully covered by the timeline and has to be served by the query instead
+# the timeline of a user is built from their tags the first time it is read
+async def read_user_feed(user_id: str, skip: int, limit: int):
+    if skip < 0 or limit <= 0:
+        return None
+
+    blog_ids = await _read(user_feeds_collection, user_id, skip, limit)
+    if blog_ids is None:
+        user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"tags": 1})
+        if user is None:
+            return None
+        items = await rebuild_user_feed(user_id, user["tags"])
+        blog_ids = [item["blog_id"] for item in items[skip : skip + limit]]
+
+    return blog_ids if len(blog_ids) == limit else None
+
+
+# read_tag_feed is read_user_feed for the timeline of a single tag
+async def read_tag_feed(tag: str, skip: int, limit: int):
+    if skip < 0 or limit <= 0:
+        return None
+
+    blog_ids = await _read(tag_feeds_collection, tag, skip, limit)
+    return blog_ids if blog_ids is not None and len(blog_ids) == limit else None
+
+
+# load_blogs will fetch the blogs of a timeline page in timeline order, projected when projection is given
+async def load_blogs(blog_ids: list, projection=None) -> list:
+    blogs = await blog_collection.find({"_id": {"$in": blog_ids}}, projection)
+    by_id = {blog["_id"]: blog for blog in blogs}
+    return [by_id[blog_id] for blog_id in blog_ids if blog_id in by_id]
@@ -0,0 +1,94 @@
+"""
+Caches that let an authenticated request resolve its user without crypto work or Mongo calls.
+
+token_cache maps the digest of a verified JWT to its claims until the token expires, so the
+signature of a token is only checked the first time it is seen. user_documents keeps the user
+documents that routes load for the current user. Both are process-local.
+
+revoke_user rejects every token issued to a user before the call, it is used when a password
+changes or a user is deleted. Revocations only need to outlive the tokens they reject, so they
+are kept for ACCESS_TOKEN_MINUTES. When more users are revoked within that time than revocations
+holds, the oldest revocation is dropped and every token issued before it is rejected instead, so
+users log in again rather than revoked tokens coming back.
+"""
+
+import hashlib
+import os
+import time
+from bson import ObjectId
+from cache import LRUCache, MISSING
+from database import users_collection
+from metrics import register_cache
+
+# ACCESS_TOKEN_MINUTES is the lifetime of the access tokens handed out by the login route
+ACCESS_TOKEN_MINUTES = 20
+
+token_cache = LRUCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ttl=ACCESS_TOKEN_MINUTES * 60,
+)
+user_documents = LRUCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+)
+# _revoked_before is the time of the newest revocation dropped from revocations, see _forget_revocation
+_revoked_before = 0.0
+
+
+def _forget_revocation(user_id: str, revoked_at: float):
+    global _revoked_before
+    _revoked_before = max(_revoked_before, revoked_at)
+
+
+revocations = LRUCache(
+    maxsize=int(os.getenv("REVOCATION_CACHE_SIZE", "100000")),
+    ttl=ACCESS_TOKEN_MINUTES * 60,
+    on_evict=_forget_revocation,
+)
+register_cache("tokens", token_cache)
+register_cache("users", user_documents)
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# cache_claims will remember the claims of a verified token until the token's exp (a unix timestamp)
+def cache_claims(digest: str, claims: dict, exp: float):
+    token_cache.set(digest, claims, expires_at=time.monotonic() + exp - time.time())
+
+
+def cached_claims(digest: str):
+    claims = token_cache.get(digest)
+    return None if claims is MISSING else claims
+
+
+# is_revoked will tell whether the token was issued before its user was revoked
+# tokens issued before iat was added to the claims count as issued at 0
+def is_revoked(claims: dict) -> bool:
+    issued_at = claims.get("iat", 0)
+    if issued_at < _revoked_before:
+        return True
+    revoked_at = revocations.get(claims["id"])
+    return revoked_at is not MISSING and issued_at < revoked_at
+
+
+# revoke_user will reject every token issued to the user so far and drop the cached user document
+def revoke_user(user_id: str):
+    revocations.set(user_id, time.time())
+    user_documents.delete(user_id)
+
+
+# get_user_document will return the user document of an authenticated user, from cache when possible
+async def get_user_document(user_id: str):
+    user = user_documents.get(user_id)
+    if user is MISSING:
+        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        if user is not None:
+            user_documents.set(user_id, user)
+    return user
+
+
+# forget_user_document will drop the cached user document after the user changed
+def forget_user_document(user_id: str):
+    user_documents.delete(user_id)
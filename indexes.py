@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import PyMongoError
+from database import (
+    blog_collection,
+    tag_feeds_collection,
+    jobs_collection,
+    related_collection,
+    tag_stats_collection,
+    user_feeds_collection,
+    users_collection,
+)
+from search import FIELD_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+# INDEXES is the manifest of every index the routers rely on, keyed by collection
+# each entry is (name, keys, options) and the name is what is used to compare against the server
+INDEXES = {
+    "users": [
+        ("username_unique", [("username", ASCENDING)], {"unique": True}),
+        ("email_unique", [("email", ASCENDING)], {"unique": True}),
+    ],
+    # list endpoints sort on (sort_by, _id) so that keyset pagination has a total order, see pagination.py
+    "blogs": [
+        # read_my_blogs: find({"owner_id"}).sort(sort_by, _id)
+        (
+            "owner_id_updated_at_id",
+            [("owner_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)],
+            {},
+        ),
+        (
+            "owner_id_created_at_id",
+            [("owner_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            {},
+        ),
+        # dashboard: find({"tags": {"$in"}}) and find({"tags": tag}) sorted by created_at
+        (
+            "tags_created_at_id",
+            [("tags", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            {},
+        ),
+        # read_all: find().sort(sort_by, _id)
+        ("created_at_id", [("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+        ("updated_at_id", [("updated_at", DESCENDING), ("_id", DESCENDING)], {}),
+        # read_popular: find().sort(views, _id)
+        ("views_id", [("views", DESCENDING), ("_id", DESCENDING)], {}),
+        # search.MongoTextSearch: $text over title, body and tags, weighted like search.FIELD_WEIGHTS
+        (
+            "text",
+            [("title", TEXT), ("body", TEXT), ("tags", TEXT)],
+            {"weights": FIELD_WEIGHTS},
+        ),
+    ],
+    # feeds.py: fan-out of new blogs to followers and removal of a blog from every timeline
+    "tag_feeds": [
+        ("items_blog_id", [("items.blog_id", ASCENDING)], {}),
+    ],
+    "user_feeds": [
+        ("tags", [("tags", ASCENDING)], {}),
+        ("items_blog_id", [("items.blog_id", ASCENDING)], {}),
+    ],
+    # tag_stats.tag_counts: find({"count": {"$gt": 0}}).sort("count")
+    "tag_stats": [
+        ("count", [("count", DESCENDING)], {}),
+    ],
+    # related.remove_blogs: the lists a deleted blog appears in
+    "related_blogs": [
+        ("items_blog_id", [("items.blog_id", ASCENDING)], {}),
+    ],
+    # jobs.claim: find_one_and_update({"status": {"$in"}, "lease_until": {"$lte"}})
+    "jobs": [
+        (
+            "status_lease_until",
+            [("status", ASCENDING), ("lease_until", ASCENDING)],
+            {},
+        ),
+    ],
+}
+
+COLLECTIONS = {
+    "users": users_collection,
+    "blogs": blog_collection,
+    "tag_feeds": tag_feeds_collection,
+    "user_feeds": user_feeds_collection,
+    "tag_stats": tag_stats_collection,
+    "jobs": jobs_collection,
+    "related_blogs": related_collection,
+}
+
+
+# ensure_indexes will create every index in the manifest, creating an existing index is a no-op
+# a failing index is logged instead of raised so that one bad index does not keep the app from starting
+async def ensure_indexes():
+    for collection_name, indexes in INDEXES.items():
+        collection = COLLECTIONS[collection_name]
+        for name, keys, options in indexes:
+            try:
+                await collection.create_index(keys, name=name, **options)
+            except PyMongoError as e:
+                logger.error(
+                    "Could not create index %s.%s: %s", collection_name, name, e
+                )
+
+
+# check_indexes will report the manifest indexes missing on the server and the server indexes nobody uses
+# usage comes from $indexStats, so the unused list only covers accesses since the server last restarted
+async def check_indexes() -> dict:
+    report = {"missing": [], "unused": []}
+    for collection_name, indexes in INDEXES.items():
+        collection = COLLECTIONS[collection_name]
+        existing = await collection.index_information()
+
+        for name, _, _ in indexes:
+            if name not in existing:
+                report["missing"].append(f"{collection_name}.{name}")
+
+        for stats in await collection.aggregate([{"$indexStats": {}}]):
+            if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                report["unused"].append(f"{collection_name}.{stats['name']}")
+
+    return report
+
+
+if __name__ == "__main__":
+    print(asyncio.run(check_indexes()))
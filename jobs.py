@@ -0,0 +1,195 @@
+"""
+Persistent background jobs.
+
+A job is a document in the jobs collection, so it survives restarts. The worker started by the
+lifespan in main.py claims one job at a time by taking a lease on it (lease_until) and renews the
+lease after every batch. A job whose worker died keeps status 'running' until its lease runs out
+and is then claimed again by the next worker, which continues where the previous one stopped.
+
+Handlers have to be safe to run again from the start: they select the work that is still left
+(e.g. the blogs of a user that are not deleted yet) instead of remembering a position.
+
+cascade_user_blogs is the only job so far, it is enqueued when an admin deletes a user and either
+marks the user's blogs as DELETED_OWNER (CASCADE_MODE=tombstone, the default) or deletes them
+(CASCADE_MODE=delete), CASCADE_BATCH_SIZE blogs per bulk_write.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from database import blog_collection, jobs_collection
+from schema.schemas import DELETED_OWNER
+import events
+
+logger = logging.getLogger(__name__)
+
+CASCADE_MODE = os.getenv("CASCADE_MODE", "tombstone")
+CASCADE_BATCH_SIZE = int(os.getenv("CASCADE_BATCH_SIZE", "500"))
+
+# JOB_LEASE_SECONDS is how long a job stays claimed by a worker that stopped renewing it
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# JOB_POLL_SECONDS is how often an idle worker looks for jobs enqueued by other processes
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+
+CASCADE_USER_BLOGS = "cascade_user_blogs"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _lease() -> datetime:
+    return _now() + timedelta(seconds=JOB_LEASE_SECONDS)
+
+
+# enqueue will store a new pending job and wake up the worker of this process
+async def enqueue(job_type: str, **params) -> str:
+    now = _now()
+    result = await jobs_collection.insert_one(
+        {
+            "type": job_type,
+            "params": params,
+            "status": "pending",
+            "processed": 0,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "lease_until": now,
+        }
+    )
+    worker.notify()
+    return str(result.inserted_id)
+
+
+# claim will lease the oldest job that is pending or whose worker stopped renewing it
+async def claim():
+    now = _now()
+    return await jobs_collection.find_one_and_update(
+        {"status": {"$in": ["pending", "running"]}, "lease_until": {"$lte": now}},
+        {"$set": {"status": "running", "lease_until": _lease(), "updated_at": now}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+# progress will record a finished batch and renew the lease of the job
+async def progress(job, processed: int):
+    await jobs_collection.update_one(
+        {"_id": job["_id"]},
+        {
+            "$inc": {"processed": processed},
+            "$set": {"lease_until": _lease(), "updated_at": _now()},
+        },
+    )
+
+
+async def _finish(job, job_status: str, error=None):
+    await jobs_collection.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"status": job_status, "error": error, "updated_at": _now()}},
+    )
+
+
+async def cascade_user_blogs(job):
+    owner_id = job["params"]["user_id"]
+    mode = job["params"].get("mode", CASCADE_MODE)
+    remaining = {"owner_id": owner_id}
+    if mode == "tombstone":
+        remaining["owner_username"] = {"$ne": DELETED_OWNER}
+
+    while True:
+        blogs = await blog_collection.find(remaining, limit=CASCADE_BATCH_SIZE)
+        if not blogs:
+            return
+
+        if mode == "delete":
+            await blog_collection.bulk_write(
+                [DeleteOne({"_id": blog["_id"]}) for blog in blogs], ordered=False
+            )
+            await events.blogs_deleted(blogs)
+        else:
+            await blog_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": blog["_id"]},
+                        {"$set": {"owner_username": DELETED_OWNER}},
+                    )
+                    for blog in blogs
+                ],
+                ordered=False,
+            )
+            for blog in blogs:
+                blog["owner_username"] = DELETED_OWNER
+            await events.blogs_tombstoned(blogs)
+
+        await progress(job, len(blogs))
+
+
+HANDLERS = {CASCADE_USER_BLOGS: cascade_user_blogs}
+
+
+async def run(job):
+    try:
+        await HANDLERS[job["type"]](job)
+    except asyncio.CancelledError:
+        # hand the job over to the next worker right away instead of when the lease runs out
+        await jobs_collection.update_one(
+            {"_id": job["_id"]}, {"$set": {"lease_until": _now()}}
+        )
+        raise
+    except Exception as e:
+        logger.exception("Job %s failed", job["_id"])
+        await _finish(job, "failed", str(e))
+    else:
+        await _finish(job, "done")
+
+
+# JobWorker runs the jobs one after the other in a task of the event loop
+class JobWorker:
+    def __init__(self):
+        self._task = None
+        self._wake = None
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _loop(self):
+        while True:
+            self._wake.clear()
+            try:
+                job = await claim()
+            except Exception:
+                logger.exception("Could not claim a job")
+                job = None
+
+            if job is not None:
+                try:
+                    await run(job)
+                except Exception:
+                    # the job could not be finished, it is claimed again when its lease runs out
+                    logger.exception("Job %s was interrupted", job["_id"])
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+worker = JobWorker()
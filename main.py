@@ -1,10 +1,45 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from routers import blogs, auth, users, dashboard, adminuser
+from indexes import ensure_indexes
+from security import shutdown_hasher
+from jobs import worker
+from views import view_counter
+from database import close_client, ping
+from metrics import MetricsMiddleware, render
+
+logger = logging.getLogger(__name__)
+
+
+# lifespan will run the startup code before the app starts serving and the cleanup code when it stops
+# the app refuses to start when the database does not answer the ping
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await ping()
+    except Exception:
+        logger.exception("The database is not reachable")
+        close_client()
+        raise
+    await ensure_indexes()
+    worker.start()
+    view_counter.start()
+    yield
+    await view_counter.stop()
+    await worker.stop()
+    shutdown_hasher()
+    close_client()
+
 
 app = FastAPI(
     title="Blog API",
     description="A blogapp API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
@@ -12,6 +47,12 @@ async def root():
     return {"message": "Welcome to the Blogs API. Visit /docs for documentation."}
 
 
+# metrics is scraped by Prometheus, it reports the process serving the request, see metrics.py
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+
 app.include_router(auth.router)
 app.include_router(adminuser.router)
 app.include_router(users.router)
@@ -0,0 +1,812 @@
+"""
+In-memory stand-in for the Mongo collections, selected with STORAGE_BACKEND=memory (see database.py).
+
+MemoryCollection implements the same awaitable methods as database.AsyncCollection and understands
+the part of the Mongo query and update language this app uses:
+- filters: equality (also against array elements and dotted paths into arrays), $in, $nin, $ne,
+  $lt, $lte, $gt, $gte, $exists, $type (string, date, objectId, array), $elemMatch (on arrays of
+  documents), $and, $or, $nor, and array positions in dotted paths (items.3)
+- updates: $set, $unset, $inc, $addToSet (with $each), $pull, $pullAll, $push (with $each,
+  $sort and $slice), $setOnInsert, upserts and whole document replacements
+- projections: inclusion, exclusion and $slice
+- sort, skip and limit, bulk_write, the find_one_and_* calls, distinct and count_documents
+
+create_index (called by indexes.ensure_indexes) builds a hash index on the first field of the keys,
+so equality and $in filters on that field only look at the matching documents, and enforces unique
+indexes with DuplicateKeyError. $text and aggregation pipelines are not supported, search falls back
+to search.MemorySearchBackend.
+
+Documents are copied on the way in and out, like they are when they go through the driver. Every
+call runs on the event loop without yielding, so a call is atomic like a single document write.
+"""
+
+import heapq
+from datetime import datetime
+from bson import ObjectId
+from pymongo import (
+    DeleteMany,
+    DeleteOne,
+    InsertOne,
+    ReplaceOne,
+    TEXT,
+    UpdateMany,
+    UpdateOne,
+)
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+_MISSING = object()
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+# _RANKS orders values of different types the way Mongo sorts them
+_RANKS = {
+    type(None): 1,
+    int: 2,
+    float: 2,
+    str: 3,
+    dict: 4,
+    list: 5,
+    ObjectId: 7,
+    bool: 8,
+    datetime: 9,
+}
+
+
+# _TYPES maps the $type aliases the app queries with to the Python types pymongo decodes them to
+_TYPES = {
+    "string": (str,),
+    "date": (datetime,),
+    "objectId": (ObjectId,),
+    "array": (list,),
+}
+
+
+def _rank(value) -> int:
+    if value is _MISSING:
+        return 1
+    return _RANKS.get(type(value), 10)
+
+
+def _sort_value(value):
+    rank = _rank(value)
+    if rank in (1, 4, 5, 10):
+        return (rank, 0)
+    return (rank, value)
+
+
+# _values will return every value a dotted path reaches, looking into arrays on the way
+# a value that is an array is returned together with its elements, like Mongo matches them
+def _values(doc, path: str) -> list:
+    current = [doc]
+    for key in path.split("."):
+        found = []
+        for value in current:
+            if isinstance(value, dict):
+                if key in value:
+                    found.append(value[key])
+            elif isinstance(value, list):
+                if key.isdigit() and int(key) < len(value):
+                    found.append(value[int(key)])
+                for item in value:
+                    if isinstance(item, dict) and key in item:
+                        found.append(item[key])
+        current = found
+
+    values = []
+    for value in current:
+        values.append(value)
+        if isinstance(value, list):
+            values.extend(value)
+    return values
+
+
+def _compare(op: str, value, target) -> bool:
+    if _rank(value) != _rank(target) or _rank(value) in (4, 5, 10):
+        return False
+    if op == "$lt":
+        return value < target
+    if op == "$lte":
+        return value <= target
+    if op == "$gt":
+        return value > target
+    return value >= target
+
+
+def _equals(values: list, target) -> bool:
+    if target is None:
+        return not values or None in values
+    return any(value == target and _rank(value) == _rank(target) for value in values)
+
+
+def _match_condition(values: list, condition) -> bool:
+    if not (
+        isinstance(condition, dict)
+        and condition
+        and next(iter(condition)).startswith("$")
+    ):
+        return _equals(values, condition)
+
+    for op, target in condition.items():
+        if op == "$in":
+            if not any(_equals(values, item) for item in target):
+                return False
+        elif op == "$nin":
+            if any(_equals(values, item) for item in target):
+                return False
+        elif op == "$ne":
+            if _equals(values, target):
+                return False
+        elif op == "$exists":
+            if bool(values) != bool(target):
+                return False
+        elif op in ("$lt", "$lte", "$gt", "$gte"):
+            if not any(_compare(op, value, target) for value in values):
+                return False
+        elif op == "$type":
+            if target not in _TYPES:
+                raise OperationFailure(f"unknown $type alias: {target}")
+            if not any(isinstance(value, _TYPES[target]) for value in values):
+                return False
+        elif op == "$elemMatch":
+            if not any(
+                isinstance(item, dict) and matches(item, target)
+                for value in values
+                if isinstance(value, list)
+                for item in value
+            ):
+                return False
+        else:
+            raise OperationFailure(f"unknown operator: {op}")
+    return True
+
+
+# matches will tell whether the document matches the Mongo filter
+def matches(doc, filter: dict) -> bool:
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, part) for part in condition):
+                return False
+        elif key == "$text":
+            raise OperationFailure("$text is not supported by the memory storage")
+        elif not _match_condition(_values(doc, key), condition):
+            return False
+    return True
+
+
+def _get(doc, path: str):
+    for key in path.split("."):
+        if not isinstance(doc, dict) or key not in doc:
+            return _MISSING
+        doc = doc[key]
+    return doc
+
+
+def _parent(doc, path: str, create: bool):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        if key not in doc:
+            if not create:
+                return None, keys[-1]
+            doc[key] = {}
+        doc = doc[key]
+    return doc, keys[-1]
+
+
+def _set(doc, path: str, value):
+    parent, key = _parent(doc, path, create=True)
+    parent[key] = value
+
+
+def _unset(doc, path: str):
+    parent, key = _parent(doc, path, create=False)
+    if isinstance(parent, dict):
+        parent.pop(key, None)
+
+
+def _array(doc, path: str) -> list:
+    value = _get(doc, path)
+    if value is _MISSING:
+        value = []
+        _set(doc, path, value)
+    if not isinstance(value, list):
+        raise OperationFailure(f"The field '{path}' must be an array")
+    return value
+
+
+def _each(value) -> list:
+    if isinstance(value, dict) and "$each" in value:
+        return value["$each"]
+    return [value]
+
+
+def _element_matches(element, condition) -> bool:
+    if isinstance(condition, dict) and not next(iter(condition), "").startswith("$"):
+        return isinstance(element, dict) and matches(element, condition)
+    return _match_condition([element], condition)
+
+
+# _sort_key will return the key function and the reverse flag that sort documents by the Mongo sort spec
+def _sort_key(sort) -> tuple:
+    if len({direction for _, direction in sort}) == 1:
+        # every field in the same direction, plain tuples are compared and reversed if descending
+        key = lambda doc: tuple(_sort_value(_get(doc, field)) for field, _ in sort)
+        return key, sort[0][1] == -1
+    key = lambda doc: tuple(
+        (
+            _sort_value(_get(doc, field))
+            if direction == 1
+            else _Descending(_sort_value(_get(doc, field)))
+        )
+        for field, direction in sort
+    )
+    return key, False
+
+
+# _Descending inverts the order of a sort value
+class _Descending:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _push(array: list, value):
+    array.extend(_copy(_each(value)))
+    if not isinstance(value, dict) or "$each" not in value:
+        return
+    if "$sort" in value:
+        order = value["$sort"]
+        if isinstance(order, dict):
+            key, reverse = _sort_key(list(order.items()))
+            array.sort(key=key, reverse=reverse)
+        else:
+            array.sort(key=_sort_value, reverse=order == -1)
+    if "$slice" in value:
+        limit = value["$slice"]
+        array[:] = array[:limit] if limit >= 0 else array[limit:]
+
+
+# apply_update will change doc in place with a Mongo update document
+def apply_update(doc, update: dict, inserting: bool = False):
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set":
+                _set(doc, path, _copy(value))
+            elif op == "$setOnInsert":
+                if inserting:
+                    _set(doc, path, _copy(value))
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$inc":
+                current = _get(doc, path)
+                _set(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$addToSet":
+                array = _array(doc, path)
+                for item in _each(value):
+                    if item not in array:
+                        array.append(_copy(item))
+            elif op == "$pullAll":
+                array = _array(doc, path)
+                array[:] = [item for item in array if item not in value]
+            elif op == "$pull":
+                array = _array(doc, path)
+                array[:] = [item for item in array if not _element_matches(item, value)]
+            elif op == "$push":
+                _push(_array(doc, path), value)
+            else:
+                raise OperationFailure(f"Unknown modifier: {op}")
+
+
+def _is_update(update: dict) -> bool:
+    return bool(update) and next(iter(update)).startswith("$")
+
+
+# _upsert_document will build the document an upsert inserts from the equality fields of the filter
+def _upsert_document(filter: dict, update: dict) -> dict:
+    doc = {}
+    for key, value in filter.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(value, dict) and any(op.startswith("$") for op in value):
+            continue
+        _set(doc, key, _copy(value))
+
+    if _is_update(update):
+        apply_update(doc, update, inserting=True)
+    else:
+        doc.update(_copy(update))
+    doc.setdefault("_id", ObjectId())
+    return doc
+
+
+def project(doc, projection):
+    if not projection:
+        return _copy(doc)
+
+    slices = {
+        field: spec["$slice"]
+        for field, spec in projection.items()
+        if isinstance(spec, dict) and "$slice" in spec
+    }
+    flags = {field: spec for field, spec in projection.items() if field not in slices}
+    include = any(value for field, value in flags.items() if field != "_id")
+
+    if include:
+        result = {}
+        for field, value in flags.items():
+            found = _get(doc, field)
+            if value and found is not _MISSING:
+                _set(result, field, _copy(found))
+        if flags.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for field in slices:
+            if field in doc:
+                result[field] = _copy(doc[field])
+    else:
+        result = _copy(doc)
+        for field, value in flags.items():
+            if not value:
+                _unset(result, field)
+
+    for field, spec in slices.items():
+        array = result.get(field)
+        if isinstance(array, list):
+            if isinstance(spec, list):
+                skip, limit = spec
+                result[field] = array[skip : skip + limit]
+            else:
+                result[field] = array[:spec] if spec >= 0 else array[spec:]
+    return result
+
+
+def _hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return _MISSING
+    return value
+
+
+# _Index maps the values of one field to the ids of the documents holding them
+class _Index:
+    def __init__(self, field: str, unique: bool):
+        self.field = field
+        self.unique = unique
+        self.entries = {}
+        # documents with a value that cannot be hashed, they are part of every lookup
+        self.unhashable = set()
+
+    # keys will return the values of the field in doc, arrays are indexed by their elements
+    def keys(self, doc) -> set:
+        values = _values(doc, self.field) or [None]
+        keys = set()
+        for value in values:
+            rank = _RANKS.get(type(value))
+            if rank in (1, 2, 3, 7, 8, 9):
+                keys.add(value)
+            elif rank != 5:
+                keys.add(_hashable(value))
+        return keys
+
+    def add(self, doc_id, doc):
+        for key in self.keys(doc):
+            if key is _MISSING:
+                self.unhashable.add(doc_id)
+            else:
+                self.entries.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id, doc):
+        for key in self.keys(doc):
+            if key is _MISSING:
+                self.unhashable.discard(doc_id)
+            else:
+                ids = self.entries.get(key)
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del self.entries[key]
+
+    # conflict will return the id of another document holding one of the values of doc, if any
+    def conflict(self, doc_id, doc):
+        if not self.unique:
+            return None
+        for key in self.keys(doc):
+            for other in self.entries.get(key, ()):
+                if other != doc_id:
+                    return other
+        return None
+
+    def lookup(self, condition):
+        if isinstance(condition, dict):
+            if set(condition) != {"$in"}:
+                return None
+            keys = condition["$in"]
+        elif isinstance(condition, list):
+            return None
+        else:
+            keys = [condition]
+
+        ids = set(self.unhashable)
+        for key in keys:
+            if _hashable(key) is _MISSING:
+                return None
+            ids.update(self.entries.get(key, ()))
+        return ids
+
+
+class MemoryCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._docs = {}
+        # _positions numbers the documents in insertion order, the order of a collection scan
+        self._positions = {}
+        self._next_position = 0
+        self._indexes = {}
+        self._index_info = {"_id_": {"key": [("_id", 1)]}}
+
+    def __len__(self):
+        return len(self._docs)
+
+    # _candidates will return the documents the filter can match, using the smallest index lookup
+    def _candidates(self, filter):
+        if not filter:
+            return self._docs.values()
+
+        if "_id" in filter:
+            condition = filter["_id"]
+            if not isinstance(condition, dict):
+                doc = self._docs.get(condition)
+                return [doc] if doc is not None else []
+            if set(condition) == {"$in"}:
+                docs = (self._docs.get(doc_id) for doc_id in condition["$in"])
+                return [doc for doc in docs if doc is not None]
+
+        best = None
+        for field, condition in filter.items():
+            index = self._indexes.get(field)
+            if index is None:
+                continue
+            ids = index.lookup(condition)
+            if ids is not None and (best is None or len(ids) < len(best)):
+                best = ids
+        if best is None:
+            return self._docs.values()
+        return [self._docs[doc_id] for doc_id in sorted(best, key=self._positions.get)]
+
+    def _matching(self, filter) -> list:
+        filter = filter or {}
+        return [doc for doc in self._candidates(filter) if matches(doc, filter)]
+
+    def _select(self, filter, sort=None, skip=0, limit=0) -> list:
+        docs = self._matching(filter)
+        if sort:
+            if isinstance(sort, str):
+                sort = [(sort, 1)]
+            key, reverse = _sort_key(sort)
+            if limit:
+                select = heapq.nlargest if reverse else heapq.nsmallest
+                docs = select(skip + limit, docs, key=key)
+            else:
+                docs.sort(key=key, reverse=reverse)
+        if skip:
+            docs = docs[skip:]
+        if limit:
+            docs = docs[:limit]
+        return docs
+
+    def _check_unique(self, doc_id, doc, indexes=None):
+        for index in self._indexes.values() if indexes is None else indexes:
+            if index.conflict(doc_id, doc) is not None:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} "
+                    f"index: {index.field} dup key",
+                    11000,
+                )
+
+    def _insert(self, doc):
+        doc = _copy(doc)
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.name} index: _id_", 11000
+            )
+        self._check_unique(doc["_id"], doc)
+        self._docs[doc["_id"]] = doc
+        self._positions[doc["_id"]] = self._next_position
+        self._next_position += 1
+        for index in self._indexes.values():
+            index.add(doc["_id"], doc)
+        return doc
+
+    def _remove(self, doc):
+        del self._docs[doc["_id"]]
+        del self._positions[doc["_id"]]
+        for index in self._indexes.values():
+            index.remove(doc["_id"], doc)
+
+    # _write will replace the stored document with new, keeping the indexes up to date
+    # only the indexes on one of the changed top level fields are updated, all of them if fields is None
+    def _write(self, old, new, fields=None):
+        new["_id"] = old["_id"]
+        indexes = [
+            index
+            for index in self._indexes.values()
+            if fields is None or index.field.split(".")[0] in fields
+        ]
+        self._check_unique(old["_id"], new, indexes)
+        for index in indexes:
+            index.remove(old["_id"], old)
+        self._docs[old["_id"]] = new
+        for index in indexes:
+            index.add(old["_id"], new)
+
+    def _modify(self, doc, update) -> bool:
+        if not _is_update(update):
+            new = _copy(update)
+            new["_id"] = doc["_id"]
+            if new == doc:
+                return False
+            self._write(doc, new)
+            return True
+
+        # only the top level fields named by the update are copied before it is applied
+        # array operators change the array but not its elements, so a shallow copy of the array is enough
+        fields = {}
+        for changes in update.values():
+            for path in changes:
+                field = path.split(".")[0]
+                fields[field] = fields.get(field, False) or "." in path
+        new = dict(doc)
+        for field, nested in fields.items():
+            if field in doc:
+                value = doc[field]
+                if nested:
+                    new[field] = _copy(value)
+                elif isinstance(value, list):
+                    new[field] = list(value)
+        apply_update(new, update)
+
+        if all(
+            new.get(field, _MISSING) == doc.get(field, _MISSING) for field in fields
+        ):
+            return False
+        self._write(doc, new, set(fields))
+        return True
+
+    def _update(self, filter, update, upsert=False, many=False, sort=None) -> dict:
+        docs = self._select(filter, sort=sort, limit=0 if many else 1)
+        if not docs:
+            if upsert:
+                doc = self._insert(_upsert_document(filter, update))
+                return {"n": 1, "nModified": 0, "upserted": doc["_id"]}
+            return {"n": 0, "nModified": 0}
+
+        modified = sum(self._modify(doc, update) for doc in docs)
+        return {"n": len(docs), "nModified": modified}
+
+    async def find(self, filter=None, projection=None, sort=None, skip=0, limit=0):
+        return [
+            project(doc, projection) for doc in self._select(filter, sort, skip, limit)
+        ]
+
+    async def iter_batches(self, filter=None, projection=None, batch_size=500):
+        docs = self._matching(filter)
+        for start in range(0, len(docs), batch_size):
+            yield [project(doc, projection) for doc in docs[start : start + batch_size]]
+
+    async def find_one(self, filter=None, projection=None, *args, sort=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        docs = self._select(filter, sort=sort, limit=1)
+        return project(docs[0], projection) if docs else None
+
+    async def count_documents(self, filter, **kwargs):
+        return len(self._matching(filter))
+
+    async def distinct(self, key, filter=None, **kwargs):
+        values = []
+        for doc in self._matching(filter):
+            for value in _values(doc, key):
+                if not isinstance(value, list) and value not in values:
+                    values.append(value)
+        return values
+
+    async def insert_one(self, document, **kwargs):
+        doc = self._insert(document)
+        document["_id"] = doc["_id"]
+        return InsertOneResult(doc["_id"], True)
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        errors = []
+        inserted = []
+        for index, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            try:
+                self._insert(document)
+            except DuplicateKeyError as e:
+                errors.append(
+                    {"index": index, "code": 11000, "errmsg": str(e), "op": document}
+                )
+                if ordered:
+                    break
+            else:
+                inserted.append(document["_id"])
+
+        if errors:
+            raise BulkWriteError(
+                {
+                    "writeErrors": errors,
+                    "writeConcernErrors": [],
+                    "nInserted": len(inserted),
+                    "nUpserted": 0,
+                    "nMatched": 0,
+                    "nModified": 0,
+                    "nRemoved": 0,
+                    "upserted": [],
+                }
+            )
+        return InsertManyResult(inserted, True)
+
+    async def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        return UpdateResult(self._update(filter, replacement, upsert=upsert), True)
+
+    async def update_one(self, filter, update, upsert=False, **kwargs):
+        return UpdateResult(self._update(filter, update, upsert=upsert), True)
+
+    async def update_many(self, filter, update, upsert=False, **kwargs):
+        return UpdateResult(
+            self._update(filter, update, upsert=upsert, many=True), True
+        )
+
+    async def delete_one(self, filter, **kwargs):
+        docs = self._select(filter, limit=1)
+        for doc in docs:
+            self._remove(doc)
+        return DeleteResult({"n": len(docs)}, True)
+
+    async def delete_many(self, filter, **kwargs):
+        docs = self._matching(filter)
+        for doc in docs:
+            self._remove(doc)
+        return DeleteResult({"n": len(docs)}, True)
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        result = {
+            "writeErrors": [],
+            "writeConcernErrors": [],
+            "nInserted": 0,
+            "nUpserted": 0,
+            "nMatched": 0,
+            "nModified": 0,
+            "nRemoved": 0,
+            "upserted": [],
+        }
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    request._doc.setdefault("_id", ObjectId())
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    deleted = (
+                        await self.delete_one(request._filter)
+                        if isinstance(request, DeleteOne)
+                        else await self.delete_many(request._filter)
+                    )
+                    result["nRemoved"] += deleted.deleted_count
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    raw = self._update(
+                        request._filter,
+                        request._doc,
+                        upsert=request._upsert,
+                        many=isinstance(request, UpdateMany),
+                    )
+                    if "upserted" in raw:
+                        result["nUpserted"] += 1
+                        result["upserted"].append(
+                            {"index": index, "_id": raw["upserted"]}
+                        )
+                    else:
+                        result["nMatched"] += raw["n"]
+                        result["nModified"] += raw["nModified"]
+                else:
+                    raise TypeError(f"{request!r} is not a valid request")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append(
+                    {"index": index, "code": 11000, "errmsg": str(e)}
+                )
+                if ordered:
+                    break
+
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def find_one_and_update(
+        self,
+        filter,
+        update,
+        projection=None,
+        sort=None,
+        upsert=False,
+        return_document=False,
+        **kwargs,
+    ):
+        docs = self._select(filter, sort=sort, limit=1)
+        if not docs:
+            if not upsert:
+                return None
+            doc = self._insert(_upsert_document(filter, update))
+            return project(doc, projection) if return_document else None
+
+        before = docs[0]
+        self._modify(before, update)
+        after = self._docs[before["_id"]]
+        return project(after if return_document else before, projection)
+
+    async def find_one_and_replace(self, filter, replacement, **kwargs):
+        return await self.find_one_and_update(filter, replacement, **kwargs)
+
+    async def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs):
+        docs = self._select(filter, sort=sort, limit=1)
+        if not docs:
+            return None
+        self._remove(docs[0])
+        return project(docs[0], projection)
+
+    async def aggregate(self, pipeline, **kwargs):
+        raise OperationFailure("Aggregation is not supported by the memory storage")
+
+    async def create_index(self, keys, name=None, unique=False, **kwargs):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        self._index_info[name] = {"key": list(keys), "unique": unique}
+
+        field, direction = keys[0]
+        if direction == TEXT:
+            return name
+        index = self._indexes.get(field)
+        # a unique index is only enforced on a single field, compound indexes just index their first field
+        unique = unique and len(keys) == 1
+        if index is None or (unique and not index.unique):
+            index = _Index(field, unique)
+            for doc in self._docs.values():
+                index.add(doc["_id"], doc)
+            self._indexes[field] = index
+        return name
+
+    async def index_information(self):
+        return _copy(self._index_info)
+
+    def clear(self):
+        self._docs.clear()
+        self._positions.clear()
+        for field, index in list(self._indexes.items()):
+            self._indexes[field] = _Index(field, index.unique)
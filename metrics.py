@@ -0,0 +1,206 @@
+"""
+Process metrics in the Prometheus text format, served by /metrics in main.py.
+
+Recording is a bisect and a few additions under a lock, so it costs a few microseconds. Label values
+are kept as tuples and only turned into text when /metrics is scraped. The metrics are those of the
+current process, every worker process of a deployment is scraped on its own.
+
+Recorded here:
+- http_request_duration_seconds: MetricsMiddleware, per method, route template and status code
+- mongo_command_duration_seconds: CommandTimer, a pymongo CommandListener attached in database.py
+- password_hash_queue_seconds and password_hash_seconds: security.py, per operation
+- cache_*: the caches registered with register_cache, read when /metrics is scraped
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from pymongo import monitoring
+
+# DEFAULT_BUCKETS are the upper bounds of the latency histograms, in seconds
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+HISTOGRAMS = []
+CACHES = {}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Histogram counts observations per label values into cumulative buckets, like a Prometheus histogram
+# observe may be called from the executor threads of database.py, so the series are updated under a lock
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        HISTOGRAMS.append(self)
+
+    # observe will record value for the label values given in the order of labelnames
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # one count per bucket plus the +Inf bucket, then the sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {values[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+# register_cache will expose the hit and miss counters of an LRUCache under the given name
+def register_cache(name: str, cache):
+    CACHES[name] = cache
+
+
+def _render_caches() -> list:
+    lines = []
+    for metric, kind, help in (
+        ("cache_hits_total", "counter", "Cache lookups that found a value."),
+        ("cache_misses_total", "counter", "Cache lookups that found nothing."),
+        ("cache_hit_ratio", "gauge", "Hits divided by lookups since start."),
+        ("cache_size", "gauge", "Entries currently cached."),
+    ):
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+        for name, cache in sorted(CACHES.items()):
+            stats = cache.stats()
+            value = {
+                "cache_hits_total": stats["hits"],
+                "cache_misses_total": stats["misses"],
+                "cache_hit_ratio": stats["hit_ratio"],
+                "cache_size": stats["size"],
+            }[metric]
+            lines.append(f"{metric}{_labels(('cache',), (name,))} {value}")
+    return lines
+
+
+# render will return every metric in the Prometheus text exposition format
+def render() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    lines += _render_caches()
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the end of its response.",
+    ("method", "route", "status"),
+)
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds",
+    "Duration of Mongo commands as reported by the driver.",
+    ("collection", "command", "outcome"),
+)
+hash_queue_duration = Histogram(
+    "password_hash_queue_seconds",
+    "Time a password hash or verification waited for a worker process.",
+    ("operation",),
+)
+hash_duration = Histogram(
+    "password_hash_seconds",
+    "Time a worker process spent hashing or verifying a password.",
+    ("operation",),
+)
+
+
+# MetricsMiddleware is a plain ASGI middleware, so it does not buffer or copy the response body
+# requests are labelled with the route template (e.g. /api/blogs/{blog_id}), not the raw path
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the router stores the matched route in the scope, unmatched paths share one label
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                status_code,
+            )
+
+
+# CommandTimer times every command the Mongo client sends
+# the collection is only part of the started event, so it is kept until the command finishes
+class CommandTimer(monitoring.CommandListener):
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._collections[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else ""
+        )
+
+    def _finished(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        mongo_command_duration.observe(
+            event.duration_micros / 1e6, collection, event.command_name, outcome
+        )
+
+    def succeeded(self, event):
+        self._finished(event, "success")
+
+    def failed(self, event):
+        self._finished(event, "failure")
@@ -0,0 +1,58 @@
+"""
+Backfill owner_username on blogs written before it was denormalized into the blog document.
+
+Run from the project root:  python -m migrations.backfill_owner_username [batch_size]
+
+Blogs are processed in _id order in batches, each batch resolves its owners with a single $in query
+and is written with one unordered bulk_write. Only blogs without owner_username are selected,
+so the migration can be stopped at any point and simply run again to resume.
+"""
+
+import asyncio
+import sys
+from pymongo import UpdateOne
+from database import blog_collection
+from schema.schemas import DELETED_OWNER, owner_usernames
+
+BATCH_SIZE = 1000
+
+
+async def backfill_owner_username(batch_size: int = BATCH_SIZE) -> int:
+    updated = 0
+    query = {"owner_username": {"$exists": False}}
+
+    while True:
+        blogs = await blog_collection.find(
+            query, {"owner_id": 1}, sort=[("_id", 1)], limit=batch_size
+        )
+        if not blogs:
+            return updated
+
+        owners = await owner_usernames(blog["owner_id"] for blog in blogs)
+        await blog_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": blog["_id"], "owner_username": {"$exists": False}},
+                    {
+                        "$set": {
+                            "owner_username": owners.get(
+                                blog["owner_id"], DELETED_OWNER
+                            )
+                        }
+                    },
+                )
+                for blog in blogs
+            ],
+            ordered=False,
+        )
+
+        updated += len(blogs)
+        print(f"backfilled {updated} blogs, last _id {blogs[-1]['_id']}")
+
+        # continue after the last _id so that a blog that could not be updated is not selected again
+        query = {"owner_username": {"$exists": False}, "_id": {"$gt": blogs[-1]["_id"]}}
+
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else BATCH_SIZE
+    asyncio.run(backfill_owner_username(batch_size))
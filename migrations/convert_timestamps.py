@@ -0,0 +1,84 @@
+"""
+Convert the created_at and updated_at strings of older blogs to native dates.
+
+Run from the project root:  python -m migrations.convert_timestamps [batch_size]
+
+Blogs used to be written with datetime.now().strftime("%Y-%m-%d %H:%M:%S"), the local time of the
+server. The strings are read in the local timezone of the process running the migration, set TZ
+(e.g. TZ=Europe/Berlin) when the API ran in another one, and stored as UTC dates.
+
+Blogs are processed in _id order in batches written with one unordered bulk_write each. Only blogs
+with a string timestamp are selected, so the migration can be stopped at any point and simply run
+again to resume. The feeds and tag statistics are rebuilt at the end, since both keep created_at.
+
+Run it again after deploying: the previous version writes strings until it is replaced. Until no
+string is left, pagination.py also matches the strings in date ranges and after date cursors.
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from database import blog_collection
+from migrations.rebuild_feeds import rebuild_feeds
+from migrations.rebuild_tag_stats import rebuild_tag_stats
+from schema.schemas import TIMESTAMP_FORMAT
+
+BATCH_SIZE = 1000
+FIELDS = ("created_at", "updated_at")
+
+
+# to_utc will parse a stored timestamp string, None when it is not in TIMESTAMP_FORMAT
+def to_utc(value: str):
+    try:
+        local = datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    return local.astimezone(timezone.utc)
+
+
+def _string_timestamps() -> dict:
+    return {"$or": [{field: {"$type": "string"}} for field in FIELDS]}
+
+
+async def convert_timestamps(batch_size: int = BATCH_SIZE) -> int:
+    converted = 0
+    query = _string_timestamps()
+
+    while True:
+        blogs = await blog_collection.find(
+            query, {field: 1 for field in FIELDS}, sort=[("_id", 1)], limit=batch_size
+        )
+        if not blogs:
+            break
+
+        updates = []
+        for blog in blogs:
+            dates = {
+                field: to_utc(blog[field])
+                for field in FIELDS
+                if isinstance(blog.get(field), str)
+            }
+            dates = {field: value for field, value in dates.items() if value}
+            if dates:
+                # only replace the strings that were read, a concurrent update already wrote a date
+                selector = {"_id": blog["_id"]}
+                selector.update({field: blog[field] for field in dates})
+                updates.append(UpdateOne(selector, {"$set": dates}))
+        if updates:
+            await blog_collection.bulk_write(updates, ordered=False)
+
+        converted += len(updates)
+        print(f"converted {converted} blogs, last _id {blogs[-1]['_id']}")
+
+        # continue after the last _id so that a blog with an unreadable string is not selected again
+        query = {"$and": [_string_timestamps(), {"_id": {"$gt": blogs[-1]["_id"]}}]}
+
+    await rebuild_feeds()
+    await rebuild_tag_stats()
+    return converted
+
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else BATCH_SIZE
+    asyncio.run(convert_timestamps(batch_size))
@@ -0,0 +1,41 @@
+"""
+Rebuild the materialized dashboard timelines of feeds.py from the blogs collection.
+
+Run from the project root:  python -m migrations.rebuild_feeds
+
+Every tag timeline is replaced by the newest FEED_SIZE blogs of the tag, read through the
+tags+created_at index. User timelines are dropped, they are merged again from the tag
+timelines the next time their user reads the dashboard. The rebuild is idempotent.
+"""
+
+import asyncio
+from database import blog_collection, tag_feeds_collection, user_feeds_collection
+from feeds import FEED_SIZE
+
+
+async def rebuild_feeds() -> int:
+    tags = await blog_collection.distinct("tags")
+
+    for tag in tags:
+        blogs = await blog_collection.find(
+            {"tags": tag},
+            {"created_at": 1},
+            sort=[("created_at", -1), ("_id", -1)],
+            limit=FEED_SIZE,
+        )
+        items = [
+            {"blog_id": blog["_id"], "created_at": blog["created_at"]} for blog in blogs
+        ]
+        await tag_feeds_collection.replace_one(
+            {"_id": tag},
+            {"items": items, "truncated": len(items) == FEED_SIZE},
+            upsert=True,
+        )
+
+    await user_feeds_collection.delete_many({})
+    print(f"rebuilt the timelines of {len(tags)} tags")
+    return len(tags)
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_feeds())
@@ -0,0 +1,73 @@
+"""
+Rebuild the related blog lists of related.py from the blogs collection.
+
+Run from the project root:  python -m migrations.rebuild_related
+
+The tags of every blog are read in one pass and kept in memory, together with a list of the blogs
+of every tag, newest first. Every blog is then compared with the RELATED_CANDIDATES newest blogs
+sharing one of its tags, like a new blog is, with tag weights from the same pass. The lists replace
+the related_blogs collection 1000 at a time. The rebuild is idempotent.
+"""
+
+import asyncio
+import heapq
+from itertools import islice
+from pymongo import ReplaceOne
+from database import blog_collection, related_collection
+from related import RELATED_CANDIDATES, tag_weight, top_related
+from tag_stats import timestamp
+
+BATCH_SIZE = 1000
+
+
+def _newest_first(postings: list, blog_id):
+    seen = {blog_id}
+    for _, other_id in heapq.merge(*postings, reverse=True):
+        if other_id not in seen:
+            seen.add(other_id)
+            yield other_id
+
+
+async def rebuild_related() -> int:
+    blog_tags = {}
+    tag_blogs = {}
+    async for batch in blog_collection.iter_batches(
+        projection={"tags": 1, "created_at": 1}
+    ):
+        for blog in batch:
+            tags = set(blog["tags"])
+            blog_tags[blog["_id"]] = tags
+            position = (timestamp(blog.get("created_at")), blog["_id"])
+            for tag in tags:
+                tag_blogs.setdefault(tag, []).append(position)
+
+    for blogs in tag_blogs.values():
+        blogs.sort(reverse=True)
+    weights = {tag: tag_weight(len(blogs)) for tag, blogs in tag_blogs.items()}
+
+    await related_collection.delete_many({})
+    writes = []
+    for blog_id, tags in blog_tags.items():
+        candidates = islice(
+            _newest_first([tag_blogs[tag] for tag in tags], blog_id),
+            RELATED_CANDIDATES,
+        )
+        items = top_related(
+            blog_id,
+            tags,
+            ((other_id, blog_tags[other_id]) for other_id in candidates),
+            weights,
+        )
+        writes.append(ReplaceOne({"_id": blog_id}, {"items": items}, upsert=True))
+        if len(writes) == BATCH_SIZE:
+            await related_collection.bulk_write(writes, ordered=False)
+            writes = []
+    if writes:
+        await related_collection.bulk_write(writes, ordered=False)
+
+    print(f"rebuilt the related blogs of {len(blog_tags)} blogs")
+    return len(blog_tags)
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_related())
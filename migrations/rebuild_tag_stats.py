@@ -0,0 +1,40 @@
+"""
+Rebuild the tag counters of tag_stats.py from the blogs collection.
+
+Run from the project root:  python -m migrations.rebuild_tag_stats
+
+The counters are computed in memory from one pass over the blogs and then replace the
+tag_stats collection, so run it while no blogs are being written.
+"""
+
+import asyncio
+from pymongo import ReplaceOne
+from database import blog_collection, tag_stats_collection
+from tag_stats import tag_changes
+
+
+async def rebuild_tag_stats() -> int:
+    counters = {}
+    async for batch in blog_collection.iter_batches(
+        projection={"tags": 1, "created_at": 1}
+    ):
+        for tag, (count, score) in tag_changes(batch).items():
+            total = counters.setdefault(tag, [0, 0.0])
+            total[0] += count
+            total[1] += score
+
+    await tag_stats_collection.delete_many({})
+    if counters:
+        await tag_stats_collection.bulk_write(
+            [
+                ReplaceOne({"_id": tag}, {"count": count, "score": score}, upsert=True)
+                for tag, (count, score) in counters.items()
+            ],
+            ordered=False,
+        )
+    print(f"rebuilt the counters of {len(counters)} tags")
+    return len(counters)
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_tag_stats())
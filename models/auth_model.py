@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel, EmailStr, Field, validator
 
 
@@ -60,3 +60,14 @@ class PasswordChange(BaseModel):
         if v == old_password:
             raise ValueError("New password must be different from the old password")
         return v
+
+
+# UserResponse is a user as the API returns it, it never has the password hash
+class UserResponse(BaseModel):
+    id: str
+    username: Optional[str] = None
+    email: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    role: Optional[str] = None
+    tags: Optional[List[str]] = None
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -7,3 +7,19 @@ class BlogRequest(BaseModel):
     title: str = Field(min_length=3)
     body: str = Field(min_length=4, max_length=100)
     tags: List[str] = []
+
+
+# BlogResponse is a blog as the API returns it, built by schema.schemas from the stored document
+# every field but id may be left out when only some fields were loaded, so they are all optional
+class BlogResponse(BaseModel):
+    id: str
+    title: Optional[str] = None
+    body: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    tags: Optional[List[str]] = None
+    owner: Optional[str] = None
+    # version is incremented by every update, send it back as If-Match to update or delete conditionally
+    version: Optional[int] = None
+    # views is the number of reads of the blog, written every few seconds so it lags slightly behind
+    views: Optional[int] = None
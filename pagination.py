@@ -0,0 +1,214 @@
+import base64
+import binascii
+import os
+import time
+from datetime import datetime, timezone
+from bson import json_util
+from fastapi import HTTPException, Response
+from starlette import status
+from schema.schemas import TIMESTAMP_FORMAT
+
+# SORTABLE_FIELDS are the fields list endpoints may sort on by default
+# every endpoint only allows fields that are backed by an index for its query shape, see indexes.py
+SORTABLE_FIELDS = ("created_at", "updated_at")
+
+# NEXT_CURSOR_HEADER is the response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# blogs written by older versions hold their timestamps as local time strings until
+# migrations.convert_timestamps converted them, Mongo never compares those with dates
+# while a check finds any, date ranges and cursors also match the strings, see legacy_timestamps
+TIMESTAMP_FIELDS = ("created_at", "updated_at")
+LEGACY_CHECK_SECONDS = float(os.getenv("LEGACY_CHECK_SECONDS", "60"))
+_legacy = {"found": True, "checked_at": None}
+
+
+# sort_spec will validate sort_by and return the sort as (sort_by, _id) so that the order is total
+def sort_spec(sort_by: str, sort_order: str, sortable=SORTABLE_FIELDS) -> list:
+    if sort_by not in sortable:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"sort_by must be one of {', '.join(sortable)}",
+        )
+
+    sort_direction = -1 if sort_order == "desc" else 1
+    return [(sort_by, sort_direction), ("_id", sort_direction)]
+
+
+# check_limit will refuse a page size below 1, or above maximum when one is given
+def check_limit(limit, maximum: int = None):
+    if limit is None or limit < 1 or (maximum is not None and limit > maximum):
+        bounds = f"between 1 and {maximum}" if maximum is not None else "at least 1"
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"limit must be {bounds}",
+        )
+
+
+# encode_position will turn a dictionary of BSON values into an opaque url safe token
+def encode_position(position: dict) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps(position).encode()).decode()
+
+
+# decode_position will turn a token back into the dictionary, raising a 400 for anything else
+def decode_position(token: str) -> dict:
+    try:
+        position = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        position = None
+
+    if not isinstance(position, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return position
+
+
+# encode_cursor will turn the position of the last document of a page into an opaque token
+def encode_cursor(doc: dict, sort: list) -> str:
+    (sort_by, sort_direction), _ = sort
+    return encode_position(
+        {"s": sort_by, "d": sort_direction, "v": doc.get(sort_by), "id": doc["_id"]}
+    )
+
+
+# legacy_timestamps will tell whether blogs with string timestamps may be left, checking every
+# LEGACY_CHECK_SECONDS with one query on the timestamp indexes; once none are left it stays False,
+# since blogs are only written with dates now
+async def legacy_timestamps(collection) -> bool:
+    now = time.monotonic()
+    if _legacy["found"] and (
+        _legacy["checked_at"] is None
+        or now - _legacy["checked_at"] >= LEGACY_CHECK_SECONDS
+    ):
+        _legacy["checked_at"] = now
+        legacy = await collection.find_one(
+            {"$or": [{field: {"$type": "string"}} for field in TIMESTAMP_FIELDS]},
+            {"_id": 1},
+        )
+        _legacy["found"] = legacy is not None
+    return _legacy["found"]
+
+
+def _legacy_string(value: datetime) -> str:
+    return value.astimezone().strftime(TIMESTAMP_FORMAT)
+
+
+# with_legacy_timestamps will widen the date ranges of query to the same range of legacy strings
+def with_legacy_timestamps(query: dict) -> dict:
+    query = dict(query)
+    ranges = []
+    for field in TIMESTAMP_FIELDS:
+        bounds = query.get(field)
+        if isinstance(bounds, dict) and any(
+            isinstance(value, datetime) for value in bounds.values()
+        ):
+            strings = {op: _legacy_string(value) for op, value in bounds.items()}
+            ranges.append({"$or": [{field: query.pop(field)}, {field: strings}]})
+    if not ranges:
+        return query
+    return {"$and": [query, *ranges]} if query else {"$and": ranges}
+
+
+# cursor_filter will turn a cursor back into a range query that starts right after the cursor position
+# with legacy, the blogs with string timestamps, which sort below every date, follow a date position
+def cursor_filter(cursor: str, sort: list, legacy: bool = False) -> dict:
+    (sort_by, sort_direction), _ = sort
+    position = decode_position(cursor)
+    try:
+        value, last_id = position["v"], position["id"]
+        valid = position["s"] == sort_by and position["d"] == sort_direction
+    except KeyError:
+        valid = False
+
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+    op = "$lt" if sort_direction == -1 else "$gt"
+    after = [
+        {sort_by: {op: value}},
+        {sort_by: value, "_id": {op: last_id}},
+    ]
+    if legacy and sort_direction == -1 and isinstance(value, datetime):
+        after.append({sort_by: {"$type": "string"}})
+    elif legacy and sort_direction == 1 and isinstance(value, str):
+        after.append({sort_by: {"$type": "date"}})
+    return {"$or": after}
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+# created_range will return the filter of blogs created at or after since and before until
+# both are optional, a datetime without a timezone is taken as UTC
+# every list query has an index starting with (..., created_at), so the range is an index scan
+def created_range(since: datetime = None, until: datetime = None) -> dict:
+    bounds = {}
+    if since is not None:
+        bounds["$gte"] = _utc(since)
+    if until is not None:
+        bounds["$lt"] = _utc(until)
+
+    if len(bounds) == 2 and bounds["$gte"] >= bounds["$lt"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="since must be before until",
+        )
+    return {"created_at": bounds} if bounds else {}
+
+
+# with_sort_field will add the sort field to a projection, the cursor of the next page is built from it
+def with_sort_field(projection, sort: list):
+    if projection is None:
+        return None
+    (sort_by, _), _ = sort
+    return {**projection, sort_by: 1}
+
+
+# paginate will run query on collection and return one page of documents
+# a cursor takes precedence over page, page-number mode is kept for backwards compatibility
+# when the page is full the cursor of the next page is set on the response header
+# projection optionally limits the loaded fields, see schema.schemas.blog_fields
+async def paginate(
+    collection,
+    query: dict,
+    response: Response,
+    sort_by: str,
+    sort_order: str,
+    limit: int,
+    page: int,
+    cursor: str = None,
+    sortable=SORTABLE_FIELDS,
+    projection=None,
+) -> list:
+    sort = sort_spec(sort_by, sort_order, sortable)
+    legacy = await legacy_timestamps(collection)
+    if legacy:
+        query = with_legacy_timestamps(query)
+
+    if cursor:
+        query = (
+            {"$and": [query, cursor_filter(cursor, sort, legacy)]}
+            if query
+            else cursor_filter(cursor, sort, legacy)
+        )
+        skip = 0
+    else:
+        skip = (page - 1) * limit
+
+    docs = await collection.find(
+        query, with_sort_field(projection, sort), sort=sort, skip=skip, limit=limit
+    )
+    set_next_cursor(response, docs, limit, sort)
+    return docs
+
+
+# set_next_cursor will set the cursor of the next page on the response when the page is full
+def set_next_cursor(response: Response, docs: list, limit: int, sort: list):
+    if limit and len(docs) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1], sort)
@@ -0,0 +1,222 @@
+"""
+Precomputed related blogs.
+
+Every blog has a document in related_blogs with its RELATED_SIZE most similar blogs, as
+{"blog_id", "score"} entries kept sorted by score, so the related blogs of a page are one bounded
+$slice read and an $in on _id, whatever the size of the collection.
+
+The similarity of two blogs is the sum of the weights of the tags they share. A tag weighs
+1 / log2(1 + number of blogs with the tag), read from tag_stats, so sharing a rare tag counts more
+than sharing a popular one. The neighbors of a blog are picked among the RELATED_CANDIDATES newest
+blogs sharing one of its tags, read through the tags+created_at index.
+
+The lists are kept up to date by events.py: a new blog gets its own list and is pushed into the
+lists of its candidates (which keep their best RELATED_SIZE entries), a deleted blog is pulled from
+every list. The blogs of a bulk insert are added together by add_blogs, with one query per
+tag and two bulk writes for the whole batch. Lists can fall short of RELATED_SIZE after deletes and scores drift as tag counts
+change, migrations.rebuild_related recomputes every list. The list of a blog written before this
+existed is built the first time it is read.
+"""
+
+import heapq
+import math
+import os
+from pymongo import ReplaceOne, UpdateOne
+from database import blog_collection, related_collection, tag_stats_collection
+from tag_stats import timestamp
+
+# RELATED_SIZE is the number of related blogs kept per blog
+RELATED_SIZE = int(os.getenv("RELATED_SIZE", "10"))
+# RELATED_CANDIDATES bounds the blogs compared with a new blog
+RELATED_CANDIDATES = int(os.getenv("RELATED_CANDIDATES", "500"))
+
+# RELATED_ORDER is the order of a list, the highest score first and the newer blog on a tie
+RELATED_ORDER = {"score": -1, "blog_id": -1}
+
+
+def tag_weight(count: int) -> float:
+    return 1 / math.log2(1 + max(count, 1))
+
+
+# tag_weights will return the weight of every tag, with one query on tag_stats
+async def tag_weights(tags) -> dict:
+    stats = await tag_stats_collection.find({"_id": {"$in": list(tags)}}, {"count": 1})
+    counts = {stat["_id"]: stat["count"] for stat in stats}
+    return {tag: tag_weight(counts.get(tag, 1)) for tag in tags}
+
+
+# top_related will score the candidates, (blog_id, tags) pairs, against tags and keep the best RELATED_SIZE
+def top_related(blog_id, tags, candidates, weights: dict) -> list:
+    tags = set(tags)
+    scored = (
+        (sum(weights[tag] for tag in tags.intersection(other_tags)), other_id)
+        for other_id, other_tags in candidates
+        if other_id != blog_id
+    )
+    best = heapq.nlargest(
+        RELATED_SIZE, ((score, other_id) for score, other_id in scored if score > 0)
+    )
+    return [{"blog_id": other_id, "score": score} for score, other_id in best]
+
+
+async def _candidates(blog) -> list:
+    return await blog_collection.find(
+        {"tags": {"$in": list(set(blog["tags"]))}, "_id": {"$ne": blog["_id"]}},
+        {"tags": 1},
+        sort=[("created_at", -1), ("_id", -1)],
+        limit=RELATED_CANDIDATES,
+    )
+
+
+# build_list will compute and store the list of the blog and return it with the candidates it compared
+async def build_list(blog) -> tuple:
+    candidates = await _candidates(blog) if blog["tags"] else []
+    weights = await tag_weights(set(blog["tags"]))
+    items = top_related(
+        blog["_id"],
+        blog["tags"],
+        ((other["_id"], other["tags"]) for other in candidates),
+        weights,
+    )
+    await related_collection.replace_one(
+        {"_id": blog["_id"]}, {"items": items}, upsert=True
+    )
+    return items, candidates, weights
+
+
+# add_blog will build the list of a new blog and offer the blog to the lists of its candidates
+# lists that do not exist yet are left alone, they are built from scratch when they are read
+async def add_blog(blog):
+    _, candidates, weights = await build_list(blog)
+    tags = set(blog["tags"])
+    updates = []
+    for other in candidates:
+        score = sum(weights[tag] for tag in tags.intersection(other["tags"]))
+        if score > 0:
+            entry = {"blog_id": blog["_id"], "score": score}
+            updates.append(
+                UpdateOne(
+                    {"_id": other["_id"]},
+                    {
+                        "$push": {
+                            "items": {
+                                "$each": [entry],
+                                "$sort": RELATED_ORDER,
+                                "$slice": RELATED_SIZE,
+                            }
+                        }
+                    },
+                )
+            )
+    if updates:
+        await related_collection.bulk_write(updates, ordered=False)
+
+
+# add_blogs is add_blog for the blogs of a bulk insert
+# the candidates are read with one query per tag of the batch and merged per blog in memory, the new
+# lists are written with one bulk_write and the offers to the lists of the candidates with another
+async def add_blogs(blogs):
+    if not blogs:
+        return
+
+    tags = set().union(*(blog["tags"] for blog in blogs))
+    weights = await tag_weights(tags)
+    # one more than RELATED_CANDIDATES per tag, since a blog is not its own candidate
+    newest = {}
+    for tag in tags:
+        newest[tag] = await blog_collection.find(
+            {"tags": tag},
+            {"tags": 1, "created_at": 1},
+            sort=[("created_at", -1), ("_id", -1)],
+            limit=RELATED_CANDIDATES + 1,
+        )
+
+    new_ids = {blog["_id"] for blog in blogs}
+    lists = []
+    offers = {}
+    for blog in blogs:
+        blog_tags = set(blog["tags"])
+        candidates = {}
+        merged = heapq.merge(
+            *(newest[tag] for tag in blog_tags),
+            key=lambda other: (timestamp(other.get("created_at")), other["_id"]),
+            reverse=True,
+        )
+        for other in merged:
+            if len(candidates) == RELATED_CANDIDATES:
+                break
+            if other["_id"] != blog["_id"]:
+                candidates.setdefault(other["_id"], other)
+
+        items = top_related(
+            blog["_id"],
+            blog_tags,
+            ((other["_id"], other["tags"]) for other in candidates.values()),
+            weights,
+        )
+        lists.append(ReplaceOne({"_id": blog["_id"]}, {"items": items}, upsert=True))
+
+        # the lists of the other new blogs are complete already, they compared this blog too
+        for other in candidates.values():
+            score = sum(weights[tag] for tag in blog_tags.intersection(other["tags"]))
+            if score > 0 and other["_id"] not in new_ids:
+                entry = {"blog_id": blog["_id"], "score": score}
+                offers.setdefault(other["_id"], []).append(entry)
+
+    await related_collection.bulk_write(lists, ordered=False)
+    if offers:
+        await related_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": other_id},
+                    {
+                        "$push": {
+                            "items": {
+                                "$each": entries,
+                                "$sort": RELATED_ORDER,
+                                "$slice": RELATED_SIZE,
+                            }
+                        }
+                    },
+                )
+                for other_id, entries in offers.items()
+            ],
+            ordered=False,
+        )
+
+
+# remove_blogs will drop the lists of the blogs and take them out of every list they are in
+async def remove_blogs(blog_ids: list):
+    if not blog_ids:
+        return
+    await related_collection.delete_many({"_id": {"$in": blog_ids}})
+    await related_collection.update_many(
+        {"items.blog_id": {"$in": blog_ids}},
+        {"$pull": {"items": {"blog_id": {"$in": blog_ids}}}},
+    )
+
+
+# update_blog will recompute the blog's place in the lists when its tags changed
+async def update_blog(before, after):
+    if set(before["tags"]) != set(after["tags"]):
+        await remove_blogs([after["_id"]])
+        await add_blog(after)
+
+
+# read_related will return the ids of the blog's first limit related blogs, best first
+# None means there is no such blog
+async def read_related(blog_id, limit: int):
+    if limit <= 0:
+        return []
+
+    related = await related_collection.find_one(
+        {"_id": blog_id}, {"items": {"$slice": limit}}
+    )
+    if related is not None:
+        return [item["blog_id"] for item in related["items"]]
+
+    blog = await blog_collection.find_one({"_id": blog_id}, {"tags": 1})
+    if blog is None:
+        return None
+    items, _, _ = await build_list(blog)
+    return [item["blog_id"] for item in items[:limit]]
@@ -0,0 +1,126 @@
+import hashlib
+import os
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from starlette import status
+from cache import LRUCache, MISSING
+from metrics import register_cache
+
+
+# CacheBackend is the interface a response cache backend implements
+# entries are (body, headers, etag) tuples, get returns None on a miss
+# the methods are async so that a backend may live out of process, e.g. in redis
+class CacheBackend:
+    async def get(self, key: str):
+        raise NotImplementedError
+
+    async def set(self, key: str, entry: tuple):
+        raise NotImplementedError
+
+    async def clear(self):
+        raise NotImplementedError
+
+
+# MemoryBackend keeps the entries of this process in an LRUCache
+class MemoryBackend(CacheBackend):
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str):
+        entry = self.entries.get(key)
+        return None if entry is MISSING else entry
+
+    async def set(self, key: str, entry: tuple):
+        self.entries.set(key, entry)
+
+    async def clear(self):
+        self.entries.clear()
+
+
+# NullBackend caches nothing, it is used when RESPONSE_CACHE_ENABLED is off
+class NullBackend(CacheBackend):
+    async def get(self, key: str):
+        return None
+
+    async def set(self, key: str, entry: tuple):
+        pass
+
+    async def clear(self):
+        pass
+
+
+# body_hash will return a short hash of a rendered body to build an ETag from
+def body_hash(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so the W/ prefix is ignored on both sides
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in candidates
+
+
+# ResponseCache caches rendered JSON responses of public GET routes and answers If-None-Match with 304
+# generation counts the invalidations, a response computed while one ran is served but not cached
+class ResponseCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.generation = 0
+
+    # serve will return the cached response for the route and params or compute and cache it
+    # compute gets a scratch Response to set headers on (e.g. X-Next-Cursor or ETag) and returns the content,
+    # either already rendered as a Response (see schema.schemas.blogs_response) or as plain data
+    # params are the parsed query params of the route, so equivalent query strings share an entry
+    async def serve(self, request: Request, params: dict, compute) -> Response:
+        key = request.url.path + "?" + repr(sorted(params.items()))
+        entry = await self.backend.get(key)
+
+        if entry is None:
+            generation = self.generation
+            scratch = Response()
+            content = await compute(scratch)
+            if isinstance(content, Response):
+                body = content.body
+            else:
+                body = ORJSONResponse(jsonable_encoder(content)).body
+            headers = {
+                name: value
+                for name, value in scratch.headers.items()
+                if name != "content-length"
+            }
+            # a route may set its own ETag, e.g. read_blog adds the version of the blog to the hash
+            etag = headers.pop("etag", None)
+            if etag is None:
+                etag = 'W/"' + body_hash(body) + '"'
+            entry = (body, headers, etag)
+            # a write that invalidated meanwhile may not be in the body, so it must not outlive the request
+            if self.generation == generation:
+                await self.backend.set(key, entry)
+
+        body, headers, etag = entry
+        headers = {**headers, "ETag": etag}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    # invalidate will drop every cached response, it is called after any write to blogs
+    async def invalidate(self):
+        self.generation += 1
+        await self.backend.clear()
+
+
+if os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1":
+    response_cache = ResponseCache(
+        MemoryBackend(
+            maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "30")),
+        )
+    )
+    register_cache("responses", response_cache.backend.entries)
+else:
+    response_cache = ResponseCache(NullBackend())
@@ -1,21 +1,54 @@
-from typing import Annotated
+import os
+from typing import Annotated, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
-from database import users_collection, blog_collection
+from fastapi.responses import StreamingResponse
+from database import users_collection, blog_collection, blog_reads, jobs_collection
 from routers.auth import get_current_user
-from schema.schemas import list_serializer_user
+from schema.schemas import (
+    BLOG_FIELDS,
+    USER_FIELDS,
+    individual_serializer_job,
+    list_serializer,
+    list_serializer_user,
+    owner_cache,
+    projection,
+    requested_fields,
+    users_response,
+)
+from models.auth_model import UserResponse
 from bson import ObjectId
+from bson.errors import InvalidId
+from identity import token_cache, user_documents
+import events
+import jobs
 
 router = APIRouter(prefix="/api/adminuser", tags=["adminuser"])
 
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
+# EXPORT_BATCH_SIZE is the number of documents the export routes hold in memory at a time
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+# _object_id will parse the id of a path, an id that is not an ObjectId is a document that does not exist
+def _object_id(value: str, detail: str) -> ObjectId:
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
 """
 ADMIN ENDPOINTS
 only user with role admin can access these endpoints
 """
 
 
-@router.get("/all_users", status_code=status.HTTP_200_OK)
+@router.get(
+    "/all_users", status_code=status.HTTP_200_OK, response_model=List[UserResponse]
+)
 async def get_all_users(user: user_dependency):
     if user is None or user.get("user_role") != "admin":
         raise HTTPException(
@@ -23,11 +56,13 @@ async def get_all_users(user: user_dependency):
             detail="You have to be an admin to perform this operation.",
         )
 
-    user_obj = users_collection.find()
-    return list_serializer_user(user_obj)
+    user_obj = await users_collection.find()
+    return users_response(list_serializer_user(user_obj))
 
 
-@router.delete("/delete/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+# delete_any_user deletes the user right away and leaves their blogs to a background job
+# the response holds the id of the job, its progress is available from /jobs/{job_id}
+@router.delete("/delete/{user_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_any_user(user: user_dependency, user_id: str):
     if user is None or user.get("user_role") != "admin":
         raise HTTPException(
@@ -35,15 +70,40 @@ async def delete_any_user(user: user_dependency, user_id: str):
             detail="You have to be an admin to perform this operation.",
         )
 
-    deleting_user = users_collection.find_one({"_id": ObjectId(user_id)})
+    deleting_user = await users_collection.find_one(
+        {"_id": _object_id(user_id, "The user to be deleted is not found")}
+    )
     if deleting_user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The user to be deleted is not found",
         )
 
-    users_collection.delete_one({"_id": deleting_user["_id"]})
-    return {"message": "User deleted successfully"}
+    await users_collection.delete_one({"_id": deleting_user["_id"]})
+    owner_cache.delete(str(deleting_user["_id"]))
+    await events.user_deleted(deleting_user)
+
+    job_id = await jobs.enqueue(
+        jobs.CASCADE_USER_BLOGS, user_id=str(deleting_user["_id"])
+    )
+    return {"message": "User deleted successfully", "job_id": job_id}
+
+
+@router.get("/jobs/{job_id}", status_code=status.HTTP_200_OK)
+async def get_job(user: user_dependency, job_id: str):
+    if user is None or user.get("user_role") != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You have to be an admin to perform this operation.",
+        )
+
+    job = await jobs_collection.find_one({"_id": _object_id(job_id, "Job not found")})
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found",
+        )
+    return individual_serializer_job(job)
 
 
 @router.delete("/deleteblog/{blog_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -54,7 +114,9 @@ async def delete_any_blog(user: user_dependency, blog_id: str):
             detail="You have to be an admin to perform this operation.",
         )
 
-    blog = blog_collection.find_one({"_id": ObjectId(blog_id)})
+    blog = await blog_collection.find_one_and_delete(
+        {"_id": _object_id(blog_id, "Blog not found")}
+    )
 
     if blog is None:
         raise HTTPException(
@@ -62,5 +124,94 @@ async def delete_any_blog(user: user_dependency, blog_id: str):
             detail="Blog not found",
         )
 
-    blog_collection.delete_one({"_id": blog["_id"]})
+    await events.blog_deleted(blog)
     return {"message": "Blog deleted successfully"}
+
+
+@router.get("/cache_stats", status_code=status.HTTP_200_OK)
+async def get_cache_stats(user: user_dependency):
+    if user is None or user.get("user_role") != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You have to be an admin to perform this operation.",
+        )
+
+    return {
+        "owners": owner_cache.stats(),
+        "tokens": token_cache.stats(),
+        "users": user_documents.stats(),
+    }
+
+
+# _export_stream will serialize the documents one batch at a time as NDJSON lines or as a JSON array
+# serialize is called with the batch and the exported fields
+async def _export_stream(batches, serialize, fields: list, export_format: str):
+    first = True
+    if export_format == "json":
+        yield "["
+
+    async for batch in batches:
+        records = [
+            record.model_dump_json(exclude_unset=True)
+            for record in await serialize(batch, fields)
+        ]
+        if export_format == "ndjson":
+            yield "".join(record + "\n" for record in records)
+        elif records:
+            yield ("" if first else ",") + ",".join(records)
+            first = False
+
+    if export_format == "json":
+        yield "]"
+
+
+def _export_response(collection, field_map, fields, export_format, serialize):
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="format must be either 'ndjson' or 'json'",
+        )
+
+    selected = requested_fields(fields, field_map)
+    batches = collection.iter_batches(
+        projection=projection(field_map, selected), batch_size=EXPORT_BATCH_SIZE
+    )
+    return StreamingResponse(
+        _export_stream(batches, serialize, selected, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+    )
+
+
+async def _serialize_users(users, fields: list) -> list:
+    return list_serializer_user(users)
+
+
+# export_users streams every user, format is 'ndjson' (default) or 'json'
+# fields is an optional comma separated list of user fields, e.g. fields=username,email
+@router.get("/export/users", status_code=status.HTTP_200_OK)
+async def export_users(
+    user: user_dependency, format: str = "ndjson", fields: Optional[str] = None
+):
+    if user is None or user.get("user_role") != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You have to be an admin to perform this operation.",
+        )
+
+    return _export_response(
+        users_collection, USER_FIELDS, fields, format, _serialize_users
+    )
+
+
+# export_blogs streams every blog, with the same format and fields options as export_users
+@router.get("/export/blogs", status_code=status.HTTP_200_OK)
+async def export_blogs(
+    user: user_dependency, format: str = "ndjson", fields: Optional[str] = None
+):
+    if user is None or user.get("user_role") != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You have to be an admin to perform this operation.",
+        )
+
+    return _export_response(blog_reads, BLOG_FIELDS, fields, format, list_serializer)
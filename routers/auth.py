@@ -3,10 +3,18 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException
 from starlette import status
 from models.auth_model import CreateUserRequest, Token
-from passlib.context import CryptContext
 from database import users_collection
+from security import hash_password, verify_password
+from identity import (
+    ACCESS_TOKEN_MINUTES,
+    cache_claims,
+    cached_claims,
+    is_revoked,
+    token_digest,
+)
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from jose import JWTError, jwt
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 import os
 
@@ -18,16 +26,24 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 
-# bcrypt_context is an instance of CryptContext that will be used to hash the password
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # oauth2_bearer is an instance of OAuth2PasswordBearer that will be used to authenticate the user
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 
 # get_current_user is a dependency that will be used to authenticate the user
+# the claims of a verified token are cached until it expires, so the signature is only checked once
 async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM)
+    digest = token_digest(token)
+    claims = cached_claims(digest)
+
+    if claims is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM)
+        except JWTError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+            )
         username: str = payload.get("sub")
         user_id: int = payload.get("id")
         user_role: str = payload.get("role")
@@ -37,12 +53,22 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
             )
-        return {"username": username, "id": user_id, "user_role": user_role}
-    except JWTError:
+        claims = {"username": username, "id": user_id, "user_role": user_role}
+        if "iat" in payload:
+            claims["iat"] = payload["iat"]
+        if "exp" in payload:
+            cache_claims(digest, claims, payload["exp"])
+
+    if is_revoked(claims):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
         )
+    return {
+        "username": claims["username"],
+        "id": claims["id"],
+        "user_role": claims["user_role"],
+    }
 
 
 # create_user will create a new user in the database
@@ -59,29 +85,36 @@ async def register_user(create_user_request: CreateUserRequest):
 
     user_obj = dict(create_user_request)
 
-    if users_collection.find_one({"username": user_obj["username"]}):
+    if await users_collection.find_one({"username": user_obj["username"]}):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists"
         )
-    if users_collection.find_one({"email": user_obj["email"]}):
+    if await users_collection.find_one({"email": user_obj["email"]}):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Email already exists"
         )
 
-    hashed_password = bcrypt_context.hash(user_obj["password"])
+    hashed_password = await hash_password(user_obj["password"])
     user_obj["password"] = hashed_password
 
-    users_collection.insert_one(user_obj)
+    # the unique indexes catch a username or email registered between the checks above and the insert
+    try:
+        await users_collection.insert_one(user_obj)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or email already exists",
+        )
 
     return {"message": "User created successfully"}
 
 
 # authenticate_user will authenticate the user using the username and password
-def authenticate_user(username: str, password: str):
-    user = users_collection.find_one({"username": username})
+async def authenticate_user(username: str, password: str):
+    user = await users_collection.find_one({"username": username})
     if not user:
         return False
-    if not bcrypt_context.verify(password, user["password"]):
+    if not await verify_password(password, user["password"]):
         return False
 
     return user
@@ -91,8 +124,10 @@ def authenticate_user(username: str, password: str):
 def create_access_token(
     username: str, user_id: int, role: str, expires_delta: timedelta
 ):
-    encode = {"sub": username, "id": user_id, "role": role}
-    expires = datetime.now(timezone.utc) + expires_delta
+    now = datetime.now(timezone.utc)
+    # iat keeps sub-second precision so that identity.revoke_user can tell tokens apart
+    encode = {"sub": username, "id": user_id, "role": role, "iat": now.timestamp()}
+    expires = now + expires_delta
     encode.update({"exp": expires})
     return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
@@ -103,7 +138,7 @@ def create_access_token(
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     # async def login_for_access_token(form_data: LoginRequest):
 
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
 
     if not user:
         raise HTTPException(
@@ -112,6 +147,9 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
 
     token = create_access_token(
-        user["username"], str(user["_id"]), user["role"], timedelta(minutes=20)
+        user["username"],
+        str(user["_id"]),
+        user["role"],
+        timedelta(minutes=ACCESS_TOKEN_MINUTES),
     )
     return {"access_token": token, "token_type": "bearer"}
@@ -1,81 +1,303 @@
+import json
+import os
 from datetime import datetime
-from typing import Annotated, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
 from starlette import status
 from database import blog_collection
-from schema.schemas import individual_serializer_blog, list_serializer
+from schema.schemas import (
+    BLOG_FIELDS,
+    blog_fields,
+    blog_response,
+    blogs_response,
+    individual_serializer_blog,
+    list_serializer,
+    projection,
+    utc_now,
+)
 from bson import ObjectId
-from models.blogs_model import BlogRequest
+from bson.errors import InvalidId
+from models.blogs_model import BlogRequest, BlogResponse
+from pagination import (
+    NEXT_CURSOR_HEADER,
+    check_limit,
+    created_range,
+    decode_position,
+    encode_position,
+    paginate,
+)
+from pydantic import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from response_cache import body_hash, response_cache
+from search import search_backend
+from views import view_counter
+import feeds
+import related
+import events
 from .auth import get_current_user
 
 router = APIRouter(prefix="/api/blogs", tags=["blogs"])
 
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
+# a bulk request may carry at most BULK_MAX_ITEMS blogs, they are written BULK_CHUNK_SIZE at a time
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+# BULK_MAX_BYTES bounds the body of a bulk request, it is checked before and while the body is read
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# SEARCH_MAX_LIMIT bounds the page size of a search, every result of a page is ranked and loaded
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+# POPULAR_MAX_LIMIT bounds the page size of the popular blogs, Mongo reads a limit of 0 as no limit
+POPULAR_MAX_LIMIT = int(os.getenv("POPULAR_MAX_LIMIT", "100"))
+
+
+# new_blog will build the document of a blog created by user
+def new_blog(blog_request: BlogRequest, user: dict, current_time: datetime) -> dict:
+    blog = dict(blog_request)
+    blog["owner_id"] = user.get("id")
+    blog["owner_username"] = user.get("username")
+    blog["created_at"] = current_time
+    blog["updated_at"] = current_time
+    blog["version"] = 1
+    return blog
+
+
+# _object_id will parse the blog_id of a path, an invalid id is a blog that does not exist
+def _object_id(blog_id: str) -> ObjectId:
+    try:
+        return ObjectId(blog_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Blog not found"
+        )
+
 
 # read_all is a route that will return all the blogs in the database
 # sorted such that the most recently created blogs appear first and paginated to limit the results
-@router.get("/", status_code=status.HTTP_200_OK)
+# pass the X-Next-Cursor header of a response as cursor to get the next page without skipping
+# since and until (ISO 8601, UTC when no offset is given) only return the blogs created in that range
+# fields (e.g. fields=title,tags) or view=summary (no body) only load and return some of the fields
+# responses are cached and carry an ETag, send it back as If-None-Match to get a 304
+@router.get("/", status_code=status.HTTP_200_OK, response_model=List[BlogResponse])
 async def read_all(
+    request: Request,
     limit: Optional[int] = 10,
     page: Optional[int] = 1,
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    view: Optional[str] = "full",
 ):
-    # Define default values for sorting
-    sort_direction = -1 if sort_order == "desc" else 1
+    query = created_range(since, until)
+    selected = blog_fields(fields, view)
 
-    skip = (page - 1) * limit
-
-    # Sort by the specified field if provided and skip and limit the results to apply pagination
-    blogs = list_serializer(
-        blog_collection.find().sort(sort_by, sort_direction).skip(skip).limit(limit)
-    )
+    # Sort by the specified field if provided and paginate by cursor or page
+    async def compute(response: Response):
+        return blogs_response(
+            await list_serializer(
+                await paginate(
+                    blog_collection,
+                    query,
+                    response,
+                    sort_by,
+                    sort_order,
+                    limit,
+                    page,
+                    cursor,
+                    projection=projection(BLOG_FIELDS, selected),
+                ),
+                selected,
+            )
+        )
 
-    return blogs
+    params = {
+        "limit": limit,
+        "page": page,
+        "sort_by": sort_by,
+        "sort_order": sort_order,
+        "cursor": cursor,
+        "since": since,
+        "until": until,
+        "fields": selected,
+    }
+    return await response_cache.serve(request, params, compute)
 
 
 # read_my_blogs is a route that will return all the blogs that belong to the authenticated user
 # sorted such that the most recently updated blogs appear first and paginated to limit the results
-@router.get("/myblogs", status_code=status.HTTP_200_OK)
+# fields and view work like in read_all
+@router.get(
+    "/myblogs", status_code=status.HTTP_200_OK, response_model=List[BlogResponse]
+)
 async def read_my_blogs(
     user: user_dependency,
+    response: Response,
     limit: Optional[int] = 10,
     page: Optional[int] = 1,
     sort_by: Optional[str] = "updated_at",
     sort_order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    view: Optional[str] = "full",
 ):
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
         )
 
-    sort_direction = -1 if sort_order == "desc" else 1
+    selected = blog_fields(fields, view)
+    blogs = await list_serializer(
+        await paginate(
+            blog_collection,
+            {"owner_id": user.get("id")},
+            response,
+            sort_by,
+            sort_order,
+            limit,
+            page,
+            cursor,
+            projection=projection(BLOG_FIELDS, selected),
+        ),
+        selected,
+    )
+
+    # X-Next-Cursor was set on response, blogs_response copies it
+    return blogs_response(blogs, response)
+
+
+# search_blogs is a route that will return the blogs matching the words of q, the most relevant first
+# tag and owner (a username) optionally narrow the results down
+# pass the X-Next-Cursor header of a response as cursor to get the next page
+# fields and view limit the response like in read_all, the search backends still load whole blogs
+@router.get(
+    "/search", status_code=status.HTTP_200_OK, response_model=List[BlogResponse]
+)
+async def search_blogs(
+    response: Response,
+    q: str,
+    tag: Optional[str] = None,
+    owner: Optional[str] = None,
+    limit: Optional[int] = 10,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    view: Optional[str] = "full",
+):
+    selected = blog_fields(fields, view)
+    if not q.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="q must not be empty"
+        )
+    check_limit(limit, SEARCH_MAX_LIMIT)
+
+    after = None
+    if cursor:
+        position = decode_position(cursor)
+        if "score" not in position or "id" not in position:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+        after = (position["score"], position["id"])
 
-    skip = (page - 1) * limit
+    results = await search_backend.search(q, tag, owner, limit, after)
 
-    blogs = list_serializer(
-        blog_collection.find({"owner_id": user.get("id")})
-        .sort(sort_by, sort_direction)
-        .skip(skip)
-        .limit(limit)
+    if len(results) == limit:
+        score, blog = results[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_position(
+            {"score": score, "id": blog["_id"]}
+        )
+    return blogs_response(
+        await list_serializer([blog for _, blog in results], selected), response
     )
 
-    return blogs
 
+# read_popular is a route that will return the most read blogs, served by the views index
+# fields and view work like in read_all, views are counted by read_blog and written behind, see views.py
+@router.get(
+    "/popular", status_code=status.HTTP_200_OK, response_model=List[BlogResponse]
+)
+async def read_popular(
+    request: Request,
+    limit: Optional[int] = 10,
+    fields: Optional[str] = None,
+    view: Optional[str] = "full",
+):
+    selected = blog_fields(fields, view)
+    check_limit(limit, POPULAR_MAX_LIMIT)
 
-# Read a single blog by its ID
-@router.get("/{blog_id}", status_code=status.HTTP_200_OK)
-async def read_blog(blog_id: str):
-    try:
-        blog = individual_serializer_blog(
-            blog_collection.find_one({"_id": ObjectId(blog_id)})
+    async def compute(response: Response):
+        blogs = await blog_collection.find(
+            {},
+            projection(BLOG_FIELDS, selected),
+            sort=[("views", -1), ("_id", -1)],
+            limit=limit,
         )
-        return blog
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail=f"Blog not found"
+        return blogs_response(await list_serializer(blogs, selected))
+
+    return await response_cache.serve(
+        request, {"limit": limit, "fields": selected}, compute
+    )
+
+
+# Read a single blog by its ID
+# every read, also one answered from the cache or with a 304, counts as a view of the blog
+@router.get("/{blog_id}", status_code=status.HTTP_200_OK, response_model=BlogResponse)
+async def read_blog(request: Request, blog_id: str):
+    async def compute(response: Response):
+        try:
+            blog = await blog_collection.find_one({"_id": ObjectId(blog_id)})
+            rendered = blog_response(await individual_serializer_blog(blog))
+        except:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=f"Blog not found"
+            )
+        # a strong ETag of the version and the body, the views and owner change the body but not the version
+        # If-Match only compares the version, see _if_match_versions
+        response.headers["ETag"] = (
+            f'"{blog.get("version", 0)}-{body_hash(rendered.body)}"'
         )
+        return rendered
+
+    rendered = await response_cache.serve(request, {}, compute)
+    view_counter.record(ObjectId(blog_id))
+    return rendered
+
+
+# read_related is a route that will return the blogs most similar to the blog by their shared tags
+# the lists are precomputed by related.py, so this is one read of at most limit ids and of their blogs
+# fields and view work like in read_all
+@router.get(
+    "/{blog_id}/related",
+    status_code=status.HTTP_200_OK,
+    response_model=List[BlogResponse],
+)
+async def read_related(
+    request: Request,
+    blog_id: str,
+    limit: Optional[int] = 5,
+    fields: Optional[str] = None,
+    view: Optional[str] = "full",
+):
+    object_id = _object_id(blog_id)
+    selected = blog_fields(fields, view)
+    limit = min(limit, related.RELATED_SIZE)
+
+    async def compute(response: Response):
+        blog_ids = await related.read_related(object_id, limit)
+        if blog_ids is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=f"Blog not found"
+            )
+        blogs = await feeds.load_blogs(blog_ids, projection(BLOG_FIELDS, selected))
+        return blogs_response(await list_serializer(blogs, selected))
+
+    return await response_cache.serve(
+        request, {"limit": limit, "fields": selected}, compute
+    )
 
 
 # create_blog is a route that will create a new blog in the database
@@ -87,64 +309,259 @@ async def create_blog(user: user_dependency, blog_request: BlogRequest):
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
         )
 
-    blog = dict(blog_request)
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    blog["owner_id"] = user.get("id")
-    blog["created_at"] = current_time
-    blog["updated_at"] = current_time
-    blog_collection.insert_one(blog)
+    current_time = utc_now()
+    blog = new_blog(blog_request, user, current_time)
+    await blog_collection.insert_one(blog)
+    await events.blog_created(blog)
 
     return {"message": "Blog created successfully"}
 
 
-# update_blog is a route that will update a blog in the database
-@router.put("/{blog_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def update_blog(user: user_dependency, blog_request: BlogRequest, blog_id: str):
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+        for error in e.errors()
+    )
 
-    try:
-        blog = blog_collection.find_one({"_id": ObjectId(blog_id)})
 
-        if not blog:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail=f"Blog not found"
-            )
+def _too_many_items() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"A bulk request may contain at most {BULK_MAX_ITEMS} blogs",
+    )
 
-        if user is None or blog["owner_id"] != user.get("id"):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="You are not authorized to perform this action.",
-            )
 
-        updated_blog_data = dict(blog_request)
-        updated_blog_data["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        blog_collection.find_one_and_update(
-            {"_id": ObjectId(blog_id)}, {"$set": dict(updated_blog_data)}
+def _too_many_bytes() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"A bulk request may be at most {BULK_MAX_BYTES} bytes",
+    )
+
+
+# _body_chunks will yield the body of a bulk request as it is received
+# the request is refused with 413 from its Content-Length, or as soon as it goes past BULK_MAX_BYTES
+async def _body_chunks(request: Request):
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > BULK_MAX_BYTES:
+        raise _too_many_bytes()
+
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > BULK_MAX_BYTES:
+            raise _too_many_bytes()
+        yield chunk
+
+
+# _ndjson_items will parse an NDJSON body line by line while it is received
+# the request is refused with 413 as soon as it goes past BULK_MAX_ITEMS, before the rest is read
+# a line is never longer than BULK_MAX_BYTES, since the whole body is bounded by it
+async def _ndjson_items(request: Request) -> list:
+    items = []
+    pending = b""
+
+    def parse(line: bytes):
+        if not line.strip():
+            return
+        if len(items) == BULK_MAX_ITEMS:
+            raise _too_many_items()
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append(e)
+
+    async for chunk in _body_chunks(request):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            parse(line)
+    parse(pending)
+    return items
+
+
+# _bulk_items will parse the body of a bulk request, a JSON array or one JSON object per line
+# an NDJSON line that is not valid JSON is returned as an exception so it fails on its own
+async def _bulk_items(request: Request) -> list:
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        return await _ndjson_items(request)
+
+    body = b"".join([chunk async for chunk in _body_chunks(request)])
+    try:
+        items = json.loads(body)
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Body must be a JSON array of blogs or NDJSON",
         )
+    if len(items) > BULK_MAX_ITEMS:
+        raise _too_many_items()
+    return items
 
-    except HTTPException as e:
-        raise e
-    except:
+
+# create_blogs_bulk is a route that will create many blogs at once
+# the body is a JSON array of blogs, or one blog per line with Content-Type: application/x-ndjson
+# every item is validated like in create_blog and gets its own result, a bad item does not stop the others
+@router.post("/bulk", status_code=status.HTTP_200_OK)
+async def create_blogs_bulk(user: user_dependency, request: Request):
+    if user is None:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail=f"Blog not found"
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
         )
 
+    items = await _bulk_items(request)
+    results = [None] * len(items)
+    blogs = []
+    indexes = []
 
-# delete_blog is a route that will delete a blog from the database
-@router.delete("/{blog_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_blog(user: user_dependency, blog_id: str):
+    current_time = utc_now()
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, ValueError):
+                raise item
+            if not isinstance(item, dict):
+                raise ValueError("A blog must be a JSON object")
+            blog_request = BlogRequest(**item)
+        except ValidationError as e:
+            results[index] = {"index": index, "error": _validation_message(e)}
+        except ValueError as e:
+            results[index] = {"index": index, "error": str(e)}
+        else:
+            blogs.append(new_blog(blog_request, user, current_time))
+            indexes.append(index)
 
-    try:
-        blog = blog_collection.find_one({"_id": ObjectId(blog_id)})
-        if user is None or blog["owner_id"] != user.get("id"):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="You are not authorized to perform this action.",
-            )
+    created = []
+    for start in range(0, len(blogs), BULK_CHUNK_SIZE):
+        chunk = blogs[start : start + BULK_CHUNK_SIZE]
+        failed = {}
+        try:
+            await blog_collection.insert_many(chunk, ordered=False)
+        except BulkWriteError as e:
+            failed = {
+                error["index"]: error["errmsg"] for error in e.details["writeErrors"]
+            }
+
+        for offset, blog in enumerate(chunk):
+            index = indexes[start + offset]
+            if offset in failed:
+                results[index] = {"index": index, "error": failed[offset]}
+            else:
+                results[index] = {"index": index, "id": str(blog["_id"])}
+                created.append(blog)
+
+    if created:
+        await events.blogs_created(created)
+
+    return {
+        "inserted": len(created),
+        "failed": len(items) - len(created),
+        "results": results,
+    }
+
+
+# _if_match_versions will parse an If-Match header into the versions it allows, None when there is none
+# the header carries versions of the blog as entity tags, e.g. If-Match: "3", * matches any version
+# the ETag of read_blog, "3-<hash of the body>", is accepted too and only its version is compared,
+# so views counted since the read don't fail the write
+# If-Match uses the strong comparison, so a weak or unknown tag matches no version and the write gets 412
+def _if_match_versions(if_match: Optional[str]) -> Optional[list]:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if len(tag) > 2 and tag[0] == tag[-1] == '"':
+            version = tag[1:-1].split("-", 1)[0]
+            if version.isdigit():
+                versions.append(int(version))
+    return versions
 
-        blog_collection.find_one_and_delete({"_id": ObjectId(blog_id)})
-    except HTTPException as e:
-        raise e
-    except:
+
+# _owned_blog will return the filter matching the blog only when user owns it and has one of the versions
+# blogs written before versions existed have none and match version 0
+def _owned_blog(blog_id: ObjectId, user: dict, versions: Optional[list]) -> dict:
+    query = {"_id": blog_id, "owner_id": user.get("id")}
+    if versions is not None:
+        query["version"] = {"$in": versions + [None] if 0 in versions else versions}
+    return query
+
+
+# _write_failed will find out why an owner filtered write matched nothing, it is only run when one did
+async def _write_failed(blog_id: ObjectId, user: dict):
+    blog = await blog_collection.find_one(
+        {"_id": blog_id}, {"owner_id": 1, "version": 1}
+    )
+    if blog is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=f"Blog not found"
         )
+    if blog["owner_id"] != user.get("id"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You are not authorized to perform this action.",
+        )
+    raise HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail=f"The blog was changed, its version is {blog.get('version', 0)}",
+    )
+
+
+# update_blog is a route that will update a blog in the database
+# the ownership check and the update are a single find_one_and_update on _id and owner_id
+# send the ETag of read_blog as If-Match to only update it when nobody changed it since (else 412)
+# the ETag of the response is the new version
+@router.put("/{blog_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def update_blog(
+    user: user_dependency,
+    blog_request: BlogRequest,
+    blog_id: str,
+    response: Response,
+    if_match: Annotated[Optional[str], Header()] = None,
+):
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You are not authorized to perform this action.",
+        )
+
+    object_id = _object_id(blog_id)
+    versions = _if_match_versions(if_match)
+    updated_blog_data = dict(blog_request)
+    updated_blog_data["updated_at"] = utc_now()
+    blog = await blog_collection.find_one_and_update(
+        _owned_blog(object_id, user, versions),
+        {"$set": updated_blog_data, "$inc": {"version": 1}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if blog is None:
+        await _write_failed(object_id, user)
+
+    updated_blog = {**blog, **updated_blog_data, "version": blog.get("version", 0) + 1}
+    response.headers["ETag"] = f'"{updated_blog["version"]}"'
+    await events.blog_updated(blog, updated_blog)
+
+
+# delete_blog is a route that will delete a blog from the database
+# like update_blog it is a single owner filtered find_one_and_delete and honours If-Match
+@router.delete("/{blog_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_blog(
+    user: user_dependency,
+    blog_id: str,
+    if_match: Annotated[Optional[str], Header()] = None,
+):
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You are not authorized to perform this action.",
+        )
+
+    object_id = _object_id(blog_id)
+    versions = _if_match_versions(if_match)
+    deleted_blog = await blog_collection.find_one_and_delete(
+        _owned_blog(object_id, user, versions)
+    )
+    if deleted_blog is None:
+        await _write_failed(object_id, user)
+
+    await events.blog_deleted(deleted_blog)
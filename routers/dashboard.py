@@ -1,67 +1,211 @@
-from typing import Annotated, Optional
-from fastapi import APIRouter, Depends, HTTPException
+import os
+from datetime import datetime
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from starlette import status
-from schema.schemas import list_serializer
+from schema.schemas import (
+    BLOG_FIELDS,
+    blog_fields,
+    blogs_response,
+    list_serializer,
+    projection,
+)
+from models.blogs_model import BlogResponse
 from routers.auth import get_current_user
-from database import blog_collection, users_collection
+from database import blog_collection, blog_reads
+from pagination import (
+    check_limit,
+    created_range,
+    paginate,
+    set_next_cursor,
+    sort_spec,
+    with_sort_field,
+)
+import feeds
+import tag_stats
+from identity import get_user_document
+from response_cache import response_cache
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 user_dependency = Annotated[dict, Depends(get_current_user)]
 
+# tag queries are served by the tags+created_at index, see indexes.py
+TAG_SORTABLE_FIELDS = ("created_at",)
+
+# TAGS_MAX_LIMIT bounds the tag lists, trending_tags scores every tag but only keeps limit of them
+TAGS_MAX_LIMIT = int(os.getenv("TAGS_MAX_LIMIT", "100"))
+
+
+# the timelines only hold the newest blogs first and are addressed by page, not by cursor or date range
+def _from_feed(sort_by: str, sort_order: str, cursor: Optional[str], query) -> bool:
+    return (
+        cursor is None
+        and not query
+        and sort_by == "created_at"
+        and sort_order == "desc"
+    )
+
+
+async def _feed_page(blog_ids, response, sort_by, sort_order, limit, selected) -> list:
+    sort = sort_spec(sort_by, sort_order)
+    blogs = await feeds.load_blogs(
+        blog_ids, with_sort_field(projection(BLOG_FIELDS, selected), sort)
+    )
+    set_next_cursor(response, blogs, limit, sort)
+    return blogs
+
+
+# _blogs_page will serialize and render one page of blogs, with the headers set on response
+async def _blogs_page(blogs, response, selected):
+    return blogs_response(await list_serializer(blogs, selected), response)
+
+
 """
     This route will return the blogs that match the tags of the user.
     The user is authenticated using the user_dependency.
     sort_by and sort_order are optional query parameters that will be used to sort the blogs.
     by default, the blogs will be sorted by created_at in descending order so that the latest blogs will be returned first.
+    created_at is the only indexed sort field for tag queries.
+    The default order is served from the materialized timelines in feeds.py when they cover the page.
+    cursor is an optional X-Next-Cursor value from a previous response that takes precedence over page.
+    since and until optionally limit the blogs to those created in [since, until), see pagination.created_range.
+    fields (e.g. fields=title,tags) or view=summary (every field but the body) limit the loaded and returned fields.
 """
 
 
-@router.get("/blogs", status_code=status.HTTP_200_OK)
+@router.get("/blogs", status_code=status.HTTP_200_OK, response_model=List[BlogResponse])
 async def get_blogs_matching_users_tags(
     user: user_dependency,
+    response: Response,
     limit: Optional[int] = 10,
     page: Optional[int] = 1,
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    view: Optional[str] = "full",
 ):
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
         )
 
-    sort_direction = -1 if sort_order == "desc" else 1
-
-    skip = (page - 1) * limit
+    date_range = created_range(since, until)
+    selected = blog_fields(fields, view)
+    if _from_feed(sort_by, sort_order, cursor, date_range):
+        blog_ids = await feeds.read_user_feed(user.get("id"), (page - 1) * limit, limit)
+        if blog_ids is not None:
+            return await _blogs_page(
+                await _feed_page(
+                    blog_ids, response, sort_by, sort_order, limit, selected
+                ),
+                response,
+                selected,
+            )
 
-    user_tags = users_collection.find_one({"username": user.get("username")})["tags"]
+    user_obj = await get_user_document(user.get("id"))
+    user_tags = user_obj["tags"]
 
-    blogs_matching_tags = list_serializer(
-        blog_collection.find({"tags": {"$in": user_tags}})
-        .sort(sort_by, sort_direction)
-        .skip(skip)
-        .limit(limit)
+    return await _blogs_page(
+        await paginate(
+            blog_reads,
+            {"tags": {"$in": user_tags}, **date_range},
+            response,
+            sort_by,
+            sort_order,
+            limit,
+            page,
+            cursor,
+            sortable=TAG_SORTABLE_FIELDS,
+            projection=projection(BLOG_FIELDS, selected),
+        ),
+        response,
+        selected,
     )
 
-    return blogs_matching_tags
 
-
-@router.get("/blogs/{tag}", status_code=status.HTTP_200_OK)
+@router.get(
+    "/blogs/{tag}", status_code=status.HTTP_200_OK, response_model=List[BlogResponse]
+)
 async def get_all_blogs_with_tag(
+    request: Request,
     tag: str,
     limit: Optional[int] = 10,
     page: Optional[int] = 1,
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    view: Optional[str] = "full",
 ):
-    sort_direction = -1 if sort_order == "desc" else 1
+    date_range = created_range(since, until)
+    selected = blog_fields(fields, view)
 
-    skip = (page - 1) * limit
+    async def compute(response: Response):
+        if _from_feed(sort_by, sort_order, cursor, date_range):
+            blog_ids = await feeds.read_tag_feed(tag, (page - 1) * limit, limit)
+            if blog_ids is not None:
+                return await _blogs_page(
+                    await _feed_page(
+                        blog_ids, response, sort_by, sort_order, limit, selected
+                    ),
+                    response,
+                    selected,
+                )
 
-    blogs_with_tags = list_serializer(
-        blog_collection.find({"tags": tag})
-        .sort(sort_by, sort_direction)
-        .skip(skip)
-        .limit(limit)
-    )
+        return await _blogs_page(
+            await paginate(
+                blog_collection,
+                {"tags": tag, **date_range},
+                response,
+                sort_by,
+                sort_order,
+                limit,
+                page,
+                cursor,
+                sortable=TAG_SORTABLE_FIELDS,
+                projection=projection(BLOG_FIELDS, selected),
+            ),
+            response,
+            selected,
+        )
+
+    # this route is public, so the response is cached, see response_cache.py
+    params = {
+        "limit": limit,
+        "page": page,
+        "sort_by": sort_by,
+        "sort_order": sort_order,
+        "cursor": cursor,
+        "since": since,
+        "until": until,
+        "fields": selected,
+    }
+    return await response_cache.serve(request, params, compute)
+
+
+# get_tag_counts is a route that will return the tags with the most blogs and their number of blogs
+@router.get("/tags", status_code=status.HTTP_200_OK)
+async def get_tag_counts(request: Request, limit: Optional[int] = 20):
+    check_limit(limit, TAGS_MAX_LIMIT)
+
+    async def compute(response: Response):
+        return await tag_stats.tag_counts(limit)
+
+    return await response_cache.serve(request, {"limit": limit}, compute)
+
+
+# get_trending_tags is a route that will return the tags with the most recent activity
+# every blog counts 1 for each of its tags when it is new and half of that every half life after
+@router.get("/tags/trending", status_code=status.HTTP_200_OK)
+async def get_trending_tags(request: Request, limit: Optional[int] = 10):
+    check_limit(limit, TAGS_MAX_LIMIT)
+
+    async def compute(response: Response):
+        return await tag_stats.trending_tags(limit)
 
-    return blogs_with_tags
+    return await response_cache.serve(request, {"limit": limit}, compute)
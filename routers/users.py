@@ -1,18 +1,20 @@
 from typing import Annotated, List
 from fastapi import APIRouter, Depends, HTTPException
 from starlette import status
-from models.auth_model import PasswordChange, UpdateUserRequest
+from models.auth_model import PasswordChange, UpdateUserRequest, UserResponse
 from routers.auth import get_current_user
 from database import users_collection
-from passlib.context import CryptContext
 from bson import ObjectId
-from schema.schemas import individual_serializer_user, list_serializer_user
+from pymongo import ReturnDocument
+from schema.schemas import individual_serializer_user, user_response
+from security import hash_password, verify_password
+from identity import forget_user_document, get_user_document, revoke_user
+import events
 
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 user_dependency = Annotated[dict, Depends(get_current_user)]
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 """
@@ -21,18 +23,16 @@ all users can access these endpoints
 """
 
 
-@router.get("/info", status_code=status.HTTP_200_OK)
+@router.get("/info", status_code=status.HTTP_200_OK, response_model=UserResponse)
 async def get_current_user_info(user: user_dependency):
 
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
         )
-    user_obj = individual_serializer_user(
-        users_collection.find_one({"username": user.get("username")})
-    )
+    user_obj = individual_serializer_user(await get_user_document(user.get("id")))
 
-    return user_obj
+    return user_response(user_obj)
 
 
 # Change password endpoint for the user to change their password
@@ -41,14 +41,18 @@ async def change_password(user: user_dependency, user_verification: PasswordChan
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication failed")
 
-    user_obj = users_collection.find_one({"username": user.get("username")})
+    user_obj = await users_collection.find_one({"username": user.get("username")})
 
-    if not bcrypt_context.verify(user_verification.password, user_obj["password"]):
+    if not await verify_password(user_verification.password, user_obj["password"]):
         raise HTTPException(status_code=401, detail="Current Password is wrong")
 
-    user_obj["password"] = bcrypt_context.hash(user_verification.new_password)
+    user_obj["password"] = await hash_password(user_verification.new_password)
 
-    users_collection.find_one_and_replace({"username": user.get("username")}, user_obj)
+    await users_collection.find_one_and_replace(
+        {"username": user.get("username")}, user_obj
+    )
+    # tokens issued with the old password stop working
+    revoke_user(user.get("id"))
 
 
 # update_user_info is a route that will update the user's information in the database
@@ -57,9 +61,10 @@ async def update_user_info(user: user_dependency, user_verification: UpdateUserR
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication failed")
 
-    users_collection.find_one_and_update(
+    await users_collection.find_one_and_update(
         {"_id": ObjectId(user.get("id"))}, {"$set": dict(user_verification)}
     )
+    forget_user_document(user.get("id"))
     return {"message": "User updated successfully"}
 
 
@@ -71,9 +76,14 @@ async def add_tags_to_user(user: user_dependency, tags: List[str]):
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
         )
 
-    users_collection.update_one(
-        {"_id": ObjectId(user.get("id"))}, {"$addToSet": {"tags": {"$each": tags}}}
+    user_obj = await users_collection.find_one_and_update(
+        {"_id": ObjectId(user.get("id"))},
+        {"$addToSet": {"tags": {"$each": tags}}},
+        projection={"tags": 1},
+        return_document=ReturnDocument.AFTER,
     )
+    if user_obj is not None:
+        await events.user_tags_changed(user.get("id"), user_obj["tags"])
     return {"message": "Tags added successfully"}
 
 
@@ -85,8 +95,13 @@ async def remove_tags_from_user(user: user_dependency, tags: List[str]):
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
         )
 
-    users_collection.update_one(
-        {"_id": ObjectId(user.get("id"))}, {"$pullAll": {"tags": tags}}
+    user_obj = await users_collection.find_one_and_update(
+        {"_id": ObjectId(user.get("id"))},
+        {"$pullAll": {"tags": tags}},
+        projection={"tags": 1},
+        return_document=ReturnDocument.AFTER,
     )
+    if user_obj is not None:
+        await events.user_tags_changed(user.get("id"), user_obj["tags"])
 
     return {"message": "Tags removed successfully"}
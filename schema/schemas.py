@@ -1,41 +1,255 @@
+import os
+from datetime import datetime, timezone
+from typing import List
 from bson import ObjectId
+from fastapi import HTTPException, Response, status
+from pydantic import TypeAdapter
+from models.auth_model import UserResponse
+from models.blogs_model import BlogResponse
+from cache import LRUCache, MISSING
 from database import users_collection
+from metrics import register_cache
 
+# DELETED_OWNER is shown as the owner of blogs whose user no longer exists
+DELETED_OWNER = "Deleted-User"
 
-# individual_serializer will take a single blog and return a dictionary with the blog details
-def individual_serializer_blog(blog) -> dict:
-    user = users_collection.find_one({"_id": ObjectId(blog["owner_id"])})
+# owner_cache maps owner ids to usernames, usernames never change so the ttl only bounds staleness
+# a deleted owner is cached as None and adminuser.delete_any_user drops the entry explicitly
+owner_cache = LRUCache(
+    maxsize=int(os.getenv("OWNER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("OWNER_CACHE_TTL", "300")),
+)
+register_cache("owners", owner_cache)
 
-    if user is None:
-        owner = "Deleted-User"
-    else:
-        owner = user["username"]
-    return {
-        "id": str(blog["_id"]),
-        "title": blog["title"],
-        "body": blog["body"],
-        "created_at": blog["created_at"],
-        "updated_at": blog["updated_at"],
-        "tags": blog["tags"],
-        "owner": owner,
-    }
 
+# owner_usernames will resolve a set of owner ids to their usernames
+# ids that are not in owner_cache are looked up with a single $in query and cached
+# ids that do not belong to any user are simply missing from the returned dictionary
+async def owner_usernames(owner_ids) -> dict:
+    owners = {}
+    missing_ids = []
+    for owner_id in set(owner_ids):
+        username = owner_cache.get(owner_id)
+        if username is MISSING:
+            missing_ids.append(owner_id)
+        elif username is not None:
+            owners[owner_id] = username
 
-def list_serializer(blogs) -> list:
-    return [individual_serializer_blog(blog) for blog in blogs]
+    if missing_ids:
+        users = await users_collection.find(
+            {"_id": {"$in": [ObjectId(owner_id) for owner_id in missing_ids]}},
+            {"username": 1},
+        )
+        found = {str(user["_id"]): user["username"] for user in users}
+        for owner_id in missing_ids:
+            owner_cache.set(owner_id, found.get(owner_id))
+        owners.update(found)
 
+    return owners
+
+
+# TIMESTAMP_FORMAT is how created_at and updated_at appear in responses, always in UTC
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# utc_now will return the current UTC time at the millisecond precision BSON dates are stored with
+# so that a cursor built from a blog still points at the same position once the blog is stored
+def utc_now() -> datetime:
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+# format_timestamp will render a stored date in TIMESTAMP_FORMAT
+# blogs that were not migrated yet still hold the formatted string, it is returned as it is
+def format_timestamp(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.strftime(TIMESTAMP_FORMAT)
+    return value
+
+
+# BLOG_FIELDS maps the fields of a serialized blog to the document fields they are built from
+# it is used to turn a list of requested fields into a Mongo projection, id is always included
+BLOG_FIELDS = {
+    "id": ("_id",),
+    "title": ("title",),
+    "body": ("body",),
+    "created_at": ("created_at",),
+    "updated_at": ("updated_at",),
+    "tags": ("tags",),
+    "owner": ("owner_id", "owner_username"),
+    "version": ("version",),
+    "views": ("views",),
+}
+
+USER_FIELDS = {
+    "id": ("_id",),
+    "username": ("username",),
+    "email": ("email",),
+    "first_name": ("first_name",),
+    "last_name": ("last_name",),
+    "role": ("role",),
+    "tags": ("tags",),
+}
+
+
+# BLOG_VIEWS are the named field sets of the view parameter of the list routes, None is every field
+# summary is what feeds and index pages show, it leaves out the body
+BLOG_VIEWS = {
+    "full": None,
+    "summary": [field for field in BLOG_FIELDS if field != "body"],
+}
+
+
+# requested_fields will parse a comma separated list of serialized fields, e.g. fields=title,tags
+# None means every field, unknown fields and an empty selection are a 400
+# (an empty selection would become an empty projection, which Mongo reads as every field)
+def requested_fields(fields, field_map: dict) -> list:
+    if fields is None:
+        return list(field_map)
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    if not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="fields must name at least one field",
+        )
+    unknown = [field for field in requested if field not in field_map]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}",
+        )
+    return requested
+
+
+# blog_fields will return the blog fields a list route should load, fields takes precedence over view
+# None means every field, so that the default responses are not projected at all
+def blog_fields(fields=None, view: str = "full"):
+    if fields is not None:
+        return requested_fields(fields, BLOG_FIELDS)
+    if view not in BLOG_VIEWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"view must be one of {', '.join(BLOG_VIEWS)}",
+        )
+    return BLOG_VIEWS[view]
+
+
+# projection will return the Mongo projection that loads the given serialized fields
+# fields None means every field, for which no projection is needed
+def projection(field_map: dict, fields):
+    if fields is None:
+        return None
+    return {doc_field: 1 for field in fields for doc_field in field_map[field]}
+
+
+BLOG_DOCUMENT_FIELDS = ("title", "body", "created_at", "updated_at", "tags")
+USER_DOCUMENT_FIELDS = ("username", "email", "first_name", "last_name", "role", "tags")
+
+BLOG_LIST = TypeAdapter(List[BlogResponse])
+USER_LIST = TypeAdapter(List[UserResponse])
 
-def individual_serializer_user(user) -> dict:
-    return {
-        "id": str(user["_id"]),
-        "username": user["username"],
-        "email": user["email"],
-        "first_name": user["first_name"],
-        "last_name": user["last_name"],
-        "role": user["role"],
-        "tags": user["tags"],
-    }
+
+# blog_to_response will build the BlogResponse of a blog document without validating it again
+# blogs carry their owner_username since it is written with the blog, owners is only used for older blogs
+# fields missing from a projected document are left unset and so out of the rendered response
+# fields limits the response further, to leave out what was only loaded to build a cursor
+def blog_to_response(blog, owners: dict, fields=None) -> BlogResponse:
+    data = {field: blog[field] for field in BLOG_DOCUMENT_FIELDS if field in blog}
+    if fields is not None:
+        data = {field: value for field, value in data.items() if field in fields}
+    data["id"] = str(blog["_id"])
+    for field in ("created_at", "updated_at"):
+        if field in data:
+            data[field] = format_timestamp(data[field])
+
+    if "owner_id" in blog and (fields is None or "owner" in fields):
+        owner = blog.get("owner_username")
+        if owner is None:
+            owner = owners.get(blog["owner_id"], DELETED_OWNER)
+        data["owner"] = owner
+
+    # blogs written before versions existed have none, they are version 0 until their first update
+    if fields is None or "version" in fields:
+        data["version"] = blog.get("version", 0)
+    # views are written behind by views.py, a blog that was never read has none yet
+    if fields is None or "views" in fields:
+        data["views"] = blog.get("views", 0)
+
+    return BlogResponse.model_construct(**data)
+
+
+# individual_serializer will take a single blog and return its BlogResponse
+async def individual_serializer_blog(blog) -> BlogResponse:
+    blogs = await list_serializer([blog])
+    return blogs[0]
+
+
+# list_serializer will resolve the owners of the whole page at once instead of once per blog
+# only blogs written before owner_username was denormalized need a lookup
+# fields is the list of blog_fields the response is limited to, None for every field
+async def list_serializer(blogs, fields=None) -> list:
+    owners = {}
+    if fields is None or "owner" in fields:
+        owners = await owner_usernames(
+            blog["owner_id"]
+            for blog in blogs
+            if "owner_id" in blog and "owner_username" not in blog
+        )
+    return [blog_to_response(blog, owners, fields) for blog in blogs]
+
+
+# individual_serializer_user never includes the password hash
+# fields missing from a projected document are left unset and so out of the rendered response
+def individual_serializer_user(user) -> UserResponse:
+    data = {field: user[field] for field in USER_DOCUMENT_FIELDS if field in user}
+    data["id"] = str(user["_id"])
+    return UserResponse.model_construct(**data)
 
 
 def list_serializer_user(users) -> list:
     return [individual_serializer_user(user) for user in users]
+
+
+# the *_response functions render serialized blogs and users straight to JSON with pydantic-core
+# routes return them as they are, so FastAPI neither validates nor runs jsonable_encoder on them again
+# FastAPI does not apply the headers of an injected Response to a returned one, pass it to copy them
+def json_response(body: bytes, response: Response = None) -> Response:
+    rendered = Response(content=body, media_type="application/json")
+    if response is not None:
+        for name, value in response.headers.items():
+            if name != "content-length":
+                rendered.headers[name] = value
+    return rendered
+
+
+def blog_response(blog: BlogResponse) -> Response:
+    return json_response(blog.model_dump_json(exclude_unset=True).encode())
+
+
+def blogs_response(blogs: list, response: Response = None) -> Response:
+    return json_response(BLOG_LIST.dump_json(blogs, exclude_unset=True), response)
+
+
+def user_response(user: UserResponse) -> Response:
+    return json_response(user.model_dump_json(exclude_unset=True).encode())
+
+
+def users_response(users: list) -> Response:
+    return json_response(USER_LIST.dump_json(users, exclude_unset=True))
+
+
+# individual_serializer_job will return the progress of a background job, see jobs.py
+def individual_serializer_job(job) -> dict:
+    return {
+        "id": str(job["_id"]),
+        "type": job["type"],
+        "params": job["params"],
+        "status": job["status"],
+        "processed": job["processed"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
@@ -0,0 +1,176 @@
+"""
+Full-text search over blog title, body and tags.
+
+MongoTextSearch runs the query against the text index of the blogs collection (see indexes.py).
+MemorySearchBackend keeps an InvertedIndex of the blogs in this process, it is loaded from the
+blogs collection on the first search and kept up to date by events.py, so it also works
+without a Mongo text index. SEARCH_BACKEND selects the backend, 'mongo' or 'memory', it defaults
+to the STORAGE_BACKEND of database.py.
+
+Results are ranked by relevance and paginated by (score, _id), a page only contains results
+that rank strictly below the position of the previous page. Like the Mongo text score, the score
+of a blog only depends on the blog and the query, not on the rest of the collection, so blogs
+written between two pages do not move the results of the next page around the cursor.
+"""
+
+import asyncio
+import heapq
+import math
+import os
+import re
+from collections import Counter
+from database import STORAGE_BACKEND, blog_collection, blog_reads
+
+# FIELD_WEIGHTS is how much a match in each field counts, the text index in indexes.py uses the same
+FIELD_WEIGHTS = {"title": 3, "tags": 2, "body": 1}
+
+_TOKEN = re.compile(r"\w+")
+
+
+# tokenize will split text into lower case terms, terms of a single character are ignored
+def tokenize(text: str) -> list:
+    return [term for term in _TOKEN.findall(text.lower()) if len(term) > 1]
+
+
+# InvertedIndex maps every term to the blogs containing it with the weighted count of the term
+class InvertedIndex:
+    def __init__(self):
+        self.postings = {}
+        self.docs = {}
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, blog):
+        self.remove(blog["_id"])
+
+        weights = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            value = blog.get(field) or []
+            for text in value if isinstance(value, list) else [value]:
+                for term in tokenize(text):
+                    weights[term] += weight
+
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[blog["_id"]] = weight
+        self.docs[blog["_id"]] = (
+            list(weights),
+            set(blog.get("tags") or []),
+            blog.get("owner_username"),
+        )
+
+    def remove(self, blog_id):
+        doc = self.docs.pop(blog_id, None)
+        if doc is None:
+            return
+        for term in doc[0]:
+            postings = self.postings[term]
+            del postings[blog_id]
+            if not postings:
+                del self.postings[term]
+
+    # search will return up to limit (score, blog_id) pairs, best first
+    # after is the (score, blog_id) of the last result of the previous page
+    # a term counts 1 + log of its weighted count, there is no idf since it changes with every write
+    def search(self, query: str, tag=None, owner=None, limit: int = 10, after=None):
+        scores = Counter()
+        for term in set(tokenize(query)):
+            for blog_id, weight in self.postings.get(term, {}).items():
+                scores[blog_id] += 1 + math.log(weight)
+
+        results = (
+            (score, blog_id)
+            for blog_id, score in scores.items()
+            if (tag is None or tag in self.docs[blog_id][1])
+            and (owner is None or owner == self.docs[blog_id][2])
+            and (after is None or (score, blog_id) < after)
+        )
+        return heapq.nlargest(limit, results)
+
+
+# SearchBackend is the interface of a search backend
+# search returns up to limit (score, blog document) pairs, best first
+class SearchBackend:
+    async def search(self, query, tag=None, owner=None, limit=10, after=None):
+        raise NotImplementedError
+
+    async def add(self, blog):
+        pass
+
+    async def remove(self, blog_id):
+        pass
+
+
+class MongoTextSearch(SearchBackend):
+    async def search(self, query, tag=None, owner=None, limit=10, after=None):
+        match = {"$text": {"$search": query}}
+        if tag is not None:
+            match["tags"] = tag
+        if owner is not None:
+            match["owner_username"] = owner
+
+        pipeline = [
+            {"$match": match},
+            {"$addFields": {"score": {"$meta": "textScore"}}},
+        ]
+        if after is not None:
+            score, blog_id = after
+            pipeline.append(
+                {
+                    "$match": {
+                        "$or": [
+                            {"score": {"$lt": score}},
+                            {"score": score, "_id": {"$lt": blog_id}},
+                        ]
+                    }
+                }
+            )
+        pipeline += [{"$sort": {"score": -1, "_id": -1}}, {"$limit": limit}]
+
+        docs = await blog_reads.aggregate(pipeline)
+        return [(doc.pop("score"), doc) for doc in docs]
+
+
+class MemorySearchBackend(SearchBackend):
+    def __init__(self):
+        self.index = InvertedIndex()
+        self.loaded = False
+        self._lock = None
+
+    async def _load(self):
+        # the lock is created here and not in __init__ so that it belongs to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.loaded:
+                return
+            projection = {field: 1 for field in FIELD_WEIGHTS}
+            projection["owner_username"] = 1
+            async for batch in blog_collection.iter_batches(projection=projection):
+                for blog in batch:
+                    self.index.add(blog)
+            self.loaded = True
+
+    async def search(self, query, tag=None, owner=None, limit=10, after=None):
+        if not self.loaded:
+            await self._load()
+
+        results = self.index.search(query, tag, owner, limit, after)
+        blogs = await blog_collection.find({"_id": {"$in": [r[1] for r in results]}})
+        by_id = {blog["_id"]: blog for blog in blogs}
+        return [
+            (score, by_id[blog_id]) for score, blog_id in results if blog_id in by_id
+        ]
+
+    async def add(self, blog):
+        self.index.add(blog)
+
+    async def remove(self, blog_id):
+        self.index.remove(blog_id)
+
+
+# the memory storage has no text index, so it defaults to the memory backend
+if os.getenv("SEARCH_BACKEND", STORAGE_BACKEND) == "memory":
+    search_backend = MemorySearchBackend()
+else:
+    search_backend = MongoTextSearch()
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from starlette import status
+from passlib.context import CryptContext
+from dotenv import load_dotenv
+from metrics import hash_duration, hash_queue_duration
+import os
+
+load_dotenv()
+
+# bcrypt_context is the single CryptContext used to hash and verify every password
+bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt is deliberately slow, so hashing runs in a separate process pool and never on the event loop
+# at most HASH_POOL_SIZE hashes run at once and HASH_QUEUE_SIZE more may wait, anything beyond is rejected
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(os.cpu_count() or 1)))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "64"))
+
+_pool = None
+_in_flight = 0
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=HASH_POOL_SIZE)
+    return _pool
+
+
+def _hash(password: str) -> str:
+    return bcrypt_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return bcrypt_context.verify(password, hashed_password)
+
+
+# _timed runs in the worker process and also returns when it started and how long fn took
+def _timed(fn, *args):
+    started = time.time()
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, started, time.perf_counter() - start
+
+
+async def _submit(fn, operation: str, *args):
+    global _in_flight
+    if _in_flight >= HASH_POOL_SIZE + HASH_QUEUE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again later",
+        )
+
+    _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        result, started, duration = await loop.run_in_executor(
+            _get_pool(), _timed, fn, *args
+        )
+        hash_queue_duration.observe(max(started - submitted, 0.0), operation)
+        hash_duration.observe(duration, operation)
+        return result
+    finally:
+        _in_flight -= 1
+
+
+# hash_password will hash the password on the worker pool
+async def hash_password(password: str) -> str:
+    return await _submit(_hash, "hash", password)
+
+
+# verify_password will check the password against the stored hash on the worker pool
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _submit(_verify, "verify", password, hashed_password)
+
+
+# shutdown_hasher will stop the worker pool, it is called when the app shuts down
+def shutdown_hasher():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,112 @@
+"""
+Incrementally maintained per-tag statistics.
+
+Every tag has a document in tag_stats with the number of blogs carrying it (count) and the sum of
+2 ** ((created_at - SCORE_EPOCH) / half life) over those blogs (score). Both are only ever changed
+with $inc when a blog gains or loses a tag, see events.py.
+
+Dividing score by the same weight taken at the current time gives the time-decayed popularity of
+the tag, every blog counting 1 when it is new and half of that every TRENDING_HALF_LIFE_HOURS.
+Because the weights grow with time, SCORE_EPOCH has to be moved forward (and the stats rebuilt with
+migrations.rebuild_tag_stats) before the weights overflow, about 1000 half lives after the epoch.
+"""
+
+import heapq
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from database import tag_stats_collection
+
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "168"))
+SCORE_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+def timestamp(value) -> float:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    try:
+        return (
+            datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+            .replace(tzinfo=timezone.utc)
+            .timestamp()
+        )
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def weight(timestamp: float) -> float:
+    return 2 ** ((timestamp - SCORE_EPOCH) / (TRENDING_HALF_LIFE_HOURS * 3600))
+
+
+# tag_changes will return the {tag: (count, score)} increments for blogs gaining (sign 1) or losing (sign -1) tags
+def tag_changes(blogs, sign: int = 1) -> dict:
+    changes = defaultdict(lambda: [0, 0.0])
+    for blog in blogs:
+        blog_weight = weight(timestamp(blog.get("created_at")))
+        for tag in set(blog["tags"]):
+            changes[tag][0] += sign
+            changes[tag][1] += sign * blog_weight
+    return changes
+
+
+# apply_changes will write the increments of tag_changes with one unordered bulk_write
+async def apply_changes(changes: dict):
+    if not changes:
+        return
+    await tag_stats_collection.bulk_write(
+        [
+            UpdateOne(
+                {"_id": tag}, {"$inc": {"count": count, "score": score}}, upsert=True
+            )
+            for tag, (count, score) in changes.items()
+        ],
+        ordered=False,
+    )
+
+
+async def blogs_added(blogs):
+    await apply_changes(tag_changes(blogs))
+
+
+async def blogs_removed(blogs):
+    await apply_changes(tag_changes(blogs, sign=-1))
+
+
+# blog_updated will only touch the tags that were added or removed by the update
+async def blog_updated(before, after):
+    removed = set(before["tags"]) - set(after["tags"])
+    added = set(after["tags"]) - set(before["tags"])
+    changes = tag_changes([{**after, "tags": list(added)}])
+    for tag, (count, score) in tag_changes(
+        [{**before, "tags": list(removed)}], sign=-1
+    ).items():
+        changes[tag][0] += count
+        changes[tag][1] += score
+    await apply_changes(changes)
+
+
+# tag_counts will return the tags with the most blogs
+async def tag_counts(limit: int) -> list:
+    stats = await tag_stats_collection.find(
+        {"count": {"$gt": 0}}, {"count": 1}, sort=[("count", -1)], limit=limit
+    )
+    return [{"tag": stat["_id"], "count": stat["count"]} for stat in stats]
+
+
+# trending_tags will rank the tags by their decayed score, reading one small document per tag
+async def trending_tags(limit: int) -> list:
+    stats = await tag_stats_collection.find({"count": {"$gt": 0}})
+    now_weight = weight(time.time())
+    trending = heapq.nlargest(
+        limit,
+        ((max(stat["score"], 0.0) / now_weight, stat) for stat in stats),
+        key=lambda item: item[0],
+    )
+    return [
+        {"tag": stat["_id"], "count": stat["count"], "score": round(score, 4)}
+        for score, stat in trending
+    ]
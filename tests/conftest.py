@@ -0,0 +1,23 @@
+import os
+
+# the tests run against the in-memory storage of memory_store.py, so they need no MongoDB
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+import pytest
+
+
+# login lets a test act as a user without a token, login("alice") returns the claims of the user
+@pytest.fixture
+def login(monkeypatch):
+    from bson import ObjectId
+    from main import app
+    from routers.auth import get_current_user
+
+    current = {}
+    monkeypatch.setitem(app.dependency_overrides, get_current_user, lambda: current.get("user"))
+
+    def as_user(username, user_id=None, role="user"):
+        current["user"] = {"username": username, "id": user_id or str(ObjectId()), "user_role": role}
+        return current["user"]
+
+    return as_user
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import sys
+import os
+import threading
+
+from fastapi.testclient import TestClient
+from fastapi import status
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import routers.adminuser
+from database import AsyncCollection, blog_collection, users_collection
+from main import app
+
+client = TestClient(app)
+
+
+def _seed():
+    users = [{"username": f"export{i}", "email": f"export{i}@example.com", "first_name": "E", "last_name": str(i),
+              "role": "user", "tags": ["export"], "hashed_password": "secret"} for i in range(3)]
+    blogs = [{"title": f"export {i}", "body": "exported body", "tags": ["export"], "owner_id": "x",
+              "owner_username": "export0"} for i in range(3)]
+    asyncio.run(users_collection.insert_many(users))
+    asyncio.run(blog_collection.insert_many(blogs))
+    return users, blogs
+
+
+def _cleanup():
+    asyncio.run(users_collection.delete_many({"tags": "export"}))
+    asyncio.run(blog_collection.delete_many({"tags": "export"}))
+
+
+def test_exports_stream_every_document_in_batches(login, monkeypatch):
+    monkeypatch.setattr(routers.adminuser, "EXPORT_BATCH_SIZE", 2)
+    login("admin", role="admin")
+    users, blogs = _seed()
+
+    response = client.get("/api/adminuser/export/users")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert {user["username"] for user in users} <= {user["username"] for user in exported}
+    assert all("hashed_password" not in user for user in exported)
+
+    response = client.get("/api/adminuser/export/blogs?format=json&fields=title,tags")
+    assert response.status_code == status.HTTP_200_OK
+    exported = response.json()
+    assert {blog["title"] for blog in blogs} <= {blog["title"] for blog in exported}
+    assert all(set(blog) == {"id", "title", "tags"} for blog in exported)
+
+    assert client.get("/api/adminuser/export/blogs?format=xml").status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get("/api/adminuser/export/blogs?fields=password").status_code == status.HTTP_400_BAD_REQUEST
+    login("alice")
+    assert client.get("/api/adminuser/export/users").status_code == status.HTTP_401_UNAUTHORIZED
+    _cleanup()
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = iter(docs)
+        self.closed_on = None
+
+    def __iter__(self):
+        return self.docs
+
+    def close(self):
+        self.closed_on = threading.current_thread()
+
+
+class _Collection(AsyncCollection):
+    def __init__(self, cursor):
+        super().__init__("fake")
+        self.cursor = cursor
+
+    @property
+    def collection(self):
+        return self
+
+    def find(self, *args, **kwargs):
+        return self.cursor
+
+
+def test_iter_batches_closes_the_cursor_off_the_event_loop():
+    cursor = _Cursor([{"_id": i} for i in range(5)])
+
+    async def run():
+        batches = _Collection(cursor).iter_batches(batch_size=2)
+        assert len(await batches.__anext__()) == 2
+        await batches.aclose()
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+    assert cursor.closed_on is not None and cursor.closed_on is not loop_thread
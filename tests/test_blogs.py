@@ -5,6 +5,20 @@ from fastapi import status
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from main import app
+from bson import ObjectId
+from schema.schemas import BLOG_VIEWS, blog_to_response
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+import routers.blogs
+from database import blog_collection
+from models.blogs_model import BlogRequest
+from routers.auth import get_current_user
+from routers.blogs import _if_match_versions, _ndjson_items, _owned_blog, new_blog
+from response_cache import response_cache
+from schema.schemas import utc_now
+from views import view_counter
 
 client = TestClient(app)
 
@@ -36,7 +50,177 @@ def test_read_all_blogs():
     assert response.status_code == status.HTTP_200_OK
     assert isinstance(response.json(), list)
 
+def test_read_all_blogs_with_fields():
+    assert client.get("/api/blogs/?view=summary").status_code == status.HTTP_200_OK
+    assert client.get("/api/blogs/?fields=title,tags").status_code == status.HTTP_200_OK
+    assert client.get("/api/blogs/?fields=password").status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get("/api/blogs/?fields=").status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get("/api/blogs/?fields=,").status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get("/api/blogs/?view=everything").status_code == status.HTTP_400_BAD_REQUEST
+
+def test_search_limit_must_be_positive():
+    assert client.get("/api/blogs/search?q=cloud&limit=0").status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get("/api/blogs/search?q=cloud&limit=-1").status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get("/api/blogs/search?q=cloud&limit=1000").status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get("/api/blogs/search?q=cloud&limit=100").status_code == status.HTTP_200_OK
+
+def test_popular_limit_is_bounded():
+    assert client.get("/api/blogs/popular?limit=5").status_code == status.HTTP_200_OK
+    for limit in (0, -1, 1000):
+        assert client.get(f"/api/blogs/popular?limit={limit}").status_code == status.HTTP_400_BAD_REQUEST
+
+def test_blog_response_is_limited_to_fields():
+    blog = dict(sample_blog_data, _id=ObjectId(), owner_username="alice")
+    summary = blog_to_response(blog, {}, BLOG_VIEWS["summary"]).model_dump(exclude_unset=True)
+    assert "body" not in summary and summary["owner"] == "alice"
+    assert blog_to_response(blog, {}, ["title"]).model_dump(exclude_unset=True) == {
+        "id": str(blog["_id"]),
+        "title": sample_blog_data["title"],
+    }
+
 # def test_read_non_existing_blog():
 #     response = client.get("/non_existing_id")
 #     assert response.status_code == status.HTTP_404_NOT_FOUND
-#     assert response.json()["detail"] == "Blog not found"
\ No newline at end of file
+#     assert response.json()["detail"] == "Blog not found"
+
+def test_if_match_versions():
+    assert _if_match_versions(None) is None
+    assert _if_match_versions("*") is None
+    assert _if_match_versions('"3"') == [3]
+    assert _if_match_versions('"3", "4"') == [3, 4]
+    assert _if_match_versions('"3-9f86d081884c7d65"') == [3]
+    assert _if_match_versions('W/"3-9f86d081884c7d65"') == []
+    assert _if_match_versions('W/"3"') == []
+    assert _if_match_versions('W/"9f86d081884c7d65"') == []
+
+def test_owned_blog_filter():
+    blog_id = ObjectId()
+    user = {"id": "65facef09ae7082531f0cf30"}
+    assert _owned_blog(blog_id, user, None) == {"_id": blog_id, "owner_id": user["id"]}
+    assert _owned_blog(blog_id, user, [2])["version"] == {"$in": [2]}
+    assert _owned_blog(blog_id, user, [0])["version"] == {"$in": [0, None]}
+
+def test_update_with_if_match(monkeypatch):
+    owner = {"username": "alice", "id": "65facef09ae7082531f0cf30", "user_role": "user"}
+    other = {"username": "bob", "id": "65facef09ae7082531f0cf31", "user_role": "user"}
+    current = {"user": owner}
+    monkeypatch.setitem(app.dependency_overrides, get_current_user, lambda: current["user"])
+
+    blog = new_blog(BlogRequest(title="Versioned", body="first body", tags=["etag"]), owner, utc_now())
+    blog_id = str(asyncio.run(blog_collection.insert_one(blog)).inserted_id)
+    update = {"title": "Versioned", "body": "second body", "tags": ["etag"]}
+
+    etag = client.get(f"/api/blogs/{blog_id}").headers["ETag"]
+    assert etag.startswith('"1-')
+    response = client.put(f"/api/blogs/{blog_id}", json=update, headers={"If-Match": etag})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert response.headers["ETag"] == '"2"'
+    assert client.get(f"/api/blogs/{blog_id}").headers["ETag"].startswith('"2-')
+
+    for stale in (etag, 'W/"2"', "garbage"):
+        response = client.put(f"/api/blogs/{blog_id}", json=update, headers={"If-Match": stale})
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+    response = client.put(f"/api/blogs/{ObjectId()}", json=update, headers={"If-Match": '"2"'})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    current["user"] = other
+    response = client.put(f"/api/blogs/{blog_id}", json=update, headers={"If-Match": '"2"'})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    current["user"] = owner
+    assert client.delete(f"/api/blogs/{blog_id}", headers={"If-Match": '"1"'}).status_code == status.HTTP_412_PRECONDITION_FAILED
+    assert client.delete(f"/api/blogs/{blog_id}", headers={"If-Match": '"2"'}).status_code == status.HTTP_204_NO_CONTENT
+
+def test_read_blog_etag_changes_with_the_views(login):
+    owner = login("alice")
+    blog = new_blog(BlogRequest(title="Viewed", body="counted", tags=["views"]), owner, utc_now())
+    blog_id = str(asyncio.run(blog_collection.insert_one(blog)).inserted_id)
+
+    first = client.get(f"/api/blogs/{blog_id}")
+    etag = first.headers["ETag"]
+    assert client.get(f"/api/blogs/{blog_id}", headers={"If-None-Match": etag}).status_code == status.HTTP_304_NOT_MODIFIED
+
+    # the version stays the same, the cached response expires after RESPONSE_CACHE_TTL
+    asyncio.run(view_counter.flush())
+    asyncio.run(response_cache.invalidate())
+    response = client.get(f"/api/blogs/{blog_id}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["views"] > first.json().get("views", 0)
+    assert response.headers["ETag"] != etag and response.headers["ETag"].startswith('"1-')
+    # If-Match only compares the version, so the ETag read before the views still updates the blog
+    update = {"title": "Viewed", "body": "counted", "tags": ["views"]}
+    assert client.put(f"/api/blogs/{blog_id}", json=update, headers={"If-Match": etag}).status_code == status.HTTP_204_NO_CONTENT
+
+    asyncio.run(blog_collection.delete_one({"_id": ObjectId(blog_id)}))
+
+class _Upload:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.read = 0
+        self.headers = {}
+
+    async def stream(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+def test_ndjson_items_are_parsed_while_streaming(monkeypatch):
+    upload = _Upload([b'{"title": "a"}\n{"ti', b'tle": "b"}\r\nnot json\n\n', b'{"title": "c"}'])
+    items = asyncio.run(_ndjson_items(upload))
+    assert items[:2] == [{"title": "a"}, {"title": "b"}] and items[3] == {"title": "c"}
+    assert isinstance(items[2], ValueError)
+
+    monkeypatch.setattr(routers.blogs, "BULK_MAX_ITEMS", 2)
+    upload = _Upload([b'{}\n{}\n{}\n', b'{}\n'])
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(_ndjson_items(upload))
+    assert error.value.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert upload.read == 1
+
+    monkeypatch.setattr(routers.blogs, "BULK_MAX_BYTES", 8)
+    upload = _Upload([b'{}\n{}\n', b'{"title": "too long"}\n', b'{}\n'])
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(_ndjson_items(upload))
+    assert error.value.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert upload.read == 2
+
+def test_bulk_create(login):
+    login("bulk-writer")
+    body = [
+        {"title": "Bulk zeppelin one", "body": "first bulk body", "tags": ["bulktag"]},
+        {"title": "no", "body": "title too short", "tags": ["bulktag"]},
+        "not a blog",
+        {"title": "Bulk zeppelin two", "body": "second bulk body", "tags": ["bulktag"]},
+    ]
+    response = client.post("/api/blogs/bulk", json=body)
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert (result["inserted"], result["failed"]) == (2, 2)
+    assert [("id" in item, "error" in item) for item in result["results"]] == [(True, False), (False, True), (False, True), (True, False)]
+    first, second = result["results"][0]["id"], result["results"][3]["id"]
+
+    ndjson = b'{"title": "Bulk zeppelin three", "body": "third bulk body", "tags": ["bulktag"]}\n{broken\n'
+    response = client.post("/api/blogs/bulk", content=ndjson, headers={"Content-Type": "application/x-ndjson"})
+    assert (response.json()["inserted"], response.json()["failed"]) == (1, 1)
+    third = response.json()["results"][0]["id"]
+
+    # the tag timeline, the search index and the related lists know the new blogs
+    assert [blog["id"] for blog in client.get("/api/dashboard/blogs/bulktag?limit=3").json()] == [third, second, first]
+    assert {blog["id"] for blog in client.get("/api/blogs/search?q=zeppelin").json()} == {first, second, third}
+    assert set(blog["id"] for blog in client.get(f"/api/blogs/{first}/related").json()) == {second, third}
+
+    for blog_id in (first, second, third):
+        assert client.delete(f"/api/blogs/{blog_id}").status_code == status.HTTP_204_NO_CONTENT
+
+def test_bulk_create_refuses_oversized_bodies(login, monkeypatch):
+    login("bulk-writer")
+    monkeypatch.setattr(routers.blogs, "BULK_MAX_BYTES", 64)
+    blog = {"title": "Oversized", "body": "bulk body", "tags": []}
+    response = client.post("/api/blogs/bulk", json=[blog] * 10)
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    monkeypatch.setattr(routers.blogs, "BULK_MAX_BYTES", 1024 * 1024)
+    monkeypatch.setattr(routers.blogs, "BULK_MAX_ITEMS", 2)
+    ndjson = b"".join(json.dumps(blog).encode() + b"\n" for _ in range(3))
+    response = client.post("/api/blogs/bulk", content=ndjson, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert asyncio.run(blog_collection.count_documents({"title": "Oversized"})) == 0
@@ -0,0 +1,108 @@
+import asyncio
+import sys
+import os
+import time
+
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cache import LRUCache, MISSING
+from database import blog_collection
+from main import app
+from response_cache import MemoryBackend, ResponseCache, response_cache
+
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_and_none_values():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set("deleted", None)
+    cache.set("expired", 1, expires_at=time.monotonic() - 1)
+
+    assert cache.get("deleted") is None
+    assert cache.get("expired") is MISSING
+    assert len(cache) == 1
+
+
+def test_hit_miss_counters():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+def _request(path, if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "scheme": "http", "server": ("test", 80),
+                    "path": path, "query_string": b"", "headers": headers})
+
+
+def test_response_cache_etag_and_304():
+    cache = ResponseCache(MemoryBackend(maxsize=10, ttl=60))
+    calls = []
+
+    async def compute(response):
+        calls.append(1)
+        response.headers["X-Next-Cursor"] = "next"
+        return {"n": len(calls)}
+
+    async def run():
+        first = await cache.serve(_request("/a"), {"limit": 1}, compute)
+        etag = first.headers["ETag"]
+        assert etag.startswith('W/"') and first.headers["X-Next-Cursor"] == "next"
+        assert (await cache.serve(_request("/a"), {"limit": 1}, compute)).body == first.body
+        not_modified = await cache.serve(_request("/a", etag.removeprefix("W/")), {"limit": 1}, compute)
+        assert not_modified.status_code == 304 and not_modified.headers["ETag"] == etag
+        assert len(calls) == 1
+
+        await cache.invalidate()
+        changed = await cache.serve(_request("/a", etag), {"limit": 1}, compute)
+        assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+    asyncio.run(run())
+
+
+def test_response_computed_during_an_invalidation_is_not_cached():
+    cache = ResponseCache(MemoryBackend(maxsize=10, ttl=60))
+    bodies = iter([{"title": "before the write"}, {"title": "after the write"}])
+
+    async def compute(response):
+        body = next(bodies)
+        if body["title"] == "before the write":
+            # the write and its invalidation land while this read is in flight
+            await cache.invalidate()
+        return body
+
+    async def run():
+        assert (await cache.serve(_request("/b"), {}, compute)).body == b'{"title":"before the write"}'
+        assert (await cache.serve(_request("/b"), {}, compute)).body == b'{"title":"after the write"}'
+
+    asyncio.run(run())
+
+
+def test_writes_invalidate_cached_lists(login):
+    client = TestClient(app)
+    login("cache-writer")
+    titles = lambda: [blog["title"] for blog in client.get("/api/blogs/?limit=100").json()]
+
+    assert "Cached until written" not in titles()
+    response = client.post("/api/blogs/", json={"title": "Cached until written", "body": "some body", "tags": ["cache"]})
+    assert response.status_code == 201
+    assert "Cached until written" in titles()
+
+    asyncio.run(blog_collection.delete_many({"title": "Cached until written"}))
+    asyncio.run(response_cache.invalidate())
@@ -0,0 +1,66 @@
+import asyncio
+import sys
+import os
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import feeds
+from database import blog_collection, tag_feeds_collection, user_feeds_collection, users_collection
+from migrations.rebuild_feeds import rebuild_feeds
+
+
+def _blog(day, tags):
+    return {"_id": ObjectId(), "tags": tags, "created_at": datetime(2024, 1, day, tzinfo=timezone.utc)}
+
+
+def test_timelines_stay_prefixes_after_delete_and_retag(monkeypatch):
+    monkeypatch.setattr(feeds, "FEED_SIZE", 3)
+
+    async def run():
+        user = {"_id": ObjectId(), "username": "feeds", "tags": ["x"]}
+        await users_collection.insert_one(user)
+        user_id = str(user["_id"])
+
+        # E is older than every blog of tag x, A is the newest
+        e, d, c, b, a = blogs = [_blog(day, ["x"]) for day in range(1, 6)]
+        e["tags"] = []
+        for blog in blogs:
+            await blog_collection.insert_one(blog)
+            await feeds.add_blog(blog)
+        assert await feeds.read_tag_feed("x", 0, 3) == [a["_id"], b["_id"], c["_id"]]
+        assert await feeds.read_user_feed(user_id, 0, 3) == [a["_id"], b["_id"], c["_id"]]
+
+        await blog_collection.delete_one({"_id": b["_id"]})
+        await feeds.remove_blog(b["_id"])
+        await blog_collection.update_one({"_id": e["_id"]}, {"$set": {"tags": ["x"]}})
+        await feeds.update_blog(e, dict(e, tags=["x"]))
+
+        # D was cut from the timelines, so the first page must not be answered with E in its place
+        for read in (lambda *page: feeds.read_tag_feed("x", *page), lambda *page: feeds.read_user_feed(user_id, *page)):
+            assert await read(0, 2) == [a["_id"], c["_id"]]
+            assert await read(0, 3) is None
+
+        await rebuild_feeds()
+        assert await feeds.read_tag_feed("x", 0, 3) == [a["_id"], c["_id"], d["_id"]]
+        assert await feeds.read_user_feed(user_id, 0, 3) == [a["_id"], c["_id"], d["_id"]]
+
+        await blog_collection.delete_many({"_id": {"$in": [blog["_id"] for blog in blogs]}})
+        await users_collection.delete_one({"_id": user["_id"]})
+        await tag_feeds_collection.delete_many({})
+        await user_feeds_collection.delete_many({})
+
+    asyncio.run(run())
+
+
+def test_complete_timelines_take_older_blogs():
+    async def run():
+        new, old = _blog(2, ["y"]), _blog(1, [])
+        await feeds.add_blog(new)
+        await feeds.update_blog(old, dict(old, tags=["y"]))
+        assert await feeds.read_tag_feed("y", 0, 2) == [new["_id"], old["_id"]]
+
+        await tag_feeds_collection.delete_many({})
+
+    asyncio.run(run())
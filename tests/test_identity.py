@@ -0,0 +1,51 @@
+import asyncio
+import sys
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import identity
+from identity import cache_claims, cached_claims, is_revoked, revoke_user, token_digest
+from routers.auth import get_current_user
+
+
+def _claims(user_id, issued_at):
+    return {"username": user_id, "id": user_id, "user_role": "user", "iat": issued_at}
+
+
+def test_revoked_token_is_rejected_while_its_claims_are_cached():
+    token = "header.revoked-claims.signature"
+    cache_claims(token_digest(token), _claims("revoked-user", time.time() - 10), time.time() + 600)
+    assert asyncio.run(get_current_user(token))["id"] == "revoked-user"
+
+    revoke_user("revoked-user")
+    assert cached_claims(token_digest(token)) is not None
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_current_user(token))
+    assert error.value.status_code == 401
+
+
+def test_cached_claims_expire_at_exp():
+    cache_claims(token_digest("expired"), _claims("a", time.time() - 60), time.time() - 1)
+    cache_claims(token_digest("valid"), _claims("a", time.time()), time.time() + 60)
+
+    assert cached_claims(token_digest("expired")) is None
+    assert cached_claims(token_digest("valid"))["id"] == "a"
+
+
+def test_evicted_revocations_keep_rejecting_tokens(monkeypatch):
+    monkeypatch.setattr(identity.revocations, "maxsize", 2)
+    monkeypatch.setattr(identity, "_revoked_before", 0.0)
+    issued_at = time.time() - 10
+
+    for user_id in ("first", "second", "third"):
+        revoke_user(user_id)
+    assert len(identity.revocations) == 2
+    assert is_revoked(_claims("first", issued_at))
+
+    # a token issued after the dropped revocation is still accepted
+    assert not is_revoked(_claims("fourth", time.time() + 1))
+    identity.revocations.clear()
@@ -0,0 +1,115 @@
+import asyncio
+import sys
+import os
+
+import pytest
+from bson import ObjectId
+from fastapi import status
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import events
+import jobs
+import related
+from database import blog_collection, jobs_collection, related_collection, tag_feeds_collection
+from main import app
+from response_cache import response_cache
+from schema.schemas import DELETED_OWNER, utc_now
+from search import search_backend
+
+client = TestClient(app)
+
+
+def test_worker_survives_a_failing_job(monkeypatch):
+    claimed = [{"_id": ObjectId(), "type": jobs.CASCADE_USER_BLOGS}, {"_id": ObjectId(), "type": jobs.CASCADE_USER_BLOGS}]
+    ran = []
+
+    async def claim():
+        return claimed.pop(0) if claimed else None
+
+    async def run(job):
+        ran.append(job["_id"])
+        raise RuntimeError("the jobs collection is gone")
+
+    monkeypatch.setattr(jobs, "claim", claim)
+    monkeypatch.setattr(jobs, "run", run)
+
+    async def main():
+        worker = jobs.JobWorker()
+        worker.start()
+        await asyncio.sleep(0.05)
+        assert len(ran) == 2
+        assert not worker._task.done()
+        await worker.stop()
+
+    asyncio.run(main())
+
+
+async def _seed(owner_id):
+    now = utc_now()
+    owned = [
+        {"title": f"cascade {i}", "body": "cascading body", "tags": ["cascade"], "owner_id": owner_id,
+         "owner_username": "leaving", "created_at": now, "updated_at": now, "version": 1}
+        for i in range(3)
+    ]
+    kept = {"title": "cascade survivor", "body": "cascading body", "tags": ["cascade"], "owner_id": "someone",
+            "owner_username": "staying", "created_at": now, "updated_at": now, "version": 1}
+    await blog_collection.insert_many(owned + [kept])
+    await events.blogs_created(owned + [kept])
+    return owned, kept
+
+
+async def _cascade(owner_id, mode):
+    await jobs.enqueue(jobs.CASCADE_USER_BLOGS, user_id=owner_id, mode=mode)
+    job = await jobs.claim()
+    await jobs.run(job)
+    return await jobs_collection.find_one({"_id": job["_id"]})
+
+
+async def _cleanup(kept):
+    for blog in await blog_collection.find({"tags": "cascade"}):
+        await blog_collection.delete_one({"_id": blog["_id"]})
+        await events.blog_deleted(blog)
+    await jobs_collection.delete_many({})
+
+
+@pytest.mark.parametrize("mode", ["delete", "tombstone"])
+def test_cascade_user_blogs(mode, monkeypatch):
+    monkeypatch.setattr(jobs, "CASCADE_BATCH_SIZE", 2)
+    owner_id = str(ObjectId())
+
+    async def run():
+        owned, kept = await _seed(owner_id)
+        owned_ids = {blog["_id"] for blog in owned}
+        generation = response_cache.generation
+
+        job = await _cascade(owner_id, mode)
+        assert (job["status"], job["processed"], job["error"]) == ("done", 3, None)
+        assert response_cache.generation > generation
+
+        left = await blog_collection.find({"_id": {"$in": list(owned_ids)}})
+        timeline = (await tag_feeds_collection.find_one({"_id": "cascade"}))["items"]
+        related_ids = set(await related.read_related(kept["_id"], 10))
+        if mode == "delete":
+            assert left == []
+            assert [item["blog_id"] for item in timeline] == [kept["_id"]]
+            assert related_ids == set()
+            assert await related_collection.find({"_id": {"$in": list(owned_ids)}}) == []
+            assert {blog["_id"] for _, blog in await search_backend.search("cascading")} == {kept["_id"]}
+        else:
+            assert {blog["owner_username"] for blog in left} == {DELETED_OWNER} and len(left) == 3
+            assert {item["blog_id"] for item in timeline} == owned_ids | {kept["_id"]}
+            assert related_ids == owned_ids
+            assert await search_backend.search("cascading", owner="leaving") == []
+            assert {blog["_id"] for _, blog in await search_backend.search("cascading", owner=DELETED_OWNER)} == owned_ids
+
+        await _cleanup(kept)
+
+    asyncio.run(run())
+
+
+def test_admin_routes_answer_404_for_malformed_ids(login):
+    login("admin", role="admin")
+    assert client.get("/api/adminuser/jobs/not-an-id").status_code == status.HTTP_404_NOT_FOUND
+    assert client.delete("/api/adminuser/delete/not-an-id").status_code == status.HTTP_404_NOT_FOUND
+    assert client.delete("/api/adminuser/deleteblog/not-an-id").status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,91 @@
+import asyncio
+import sys
+import os
+
+import pytest
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from memory_store import MemoryCollection, apply_update, matches
+
+
+def test_filters():
+    doc = {"_id": 1, "tags": ["a", "b"], "items": [{"blog_id": 7}], "count": 3}
+
+    assert matches(doc, {"tags": "a"})
+    assert matches(doc, {"tags": {"$in": ["x", "b"]}})
+    assert matches(doc, {"items.blog_id": 7})
+    assert matches(doc, {"count": {"$gt": 2, "$lte": 3}})
+    assert matches(doc, {"missing": {"$ne": "x"}})
+    assert matches(doc, {"$or": [{"count": 1}, {"tags": "b"}]})
+    assert not matches(doc, {"count": {"$lt": "9"}})
+    assert not matches(doc, {"missing": {"$exists": True}})
+
+
+def test_updates():
+    doc = {"tags": ["a"], "items": [{"blog_id": 1, "n": 1}, {"blog_id": 2, "n": 2}]}
+    apply_update(doc, {"$addToSet": {"tags": {"$each": ["a", "b", "c"]}}})
+    apply_update(doc, {"$pullAll": {"tags": ["c"]}})
+    apply_update(doc, {"$pull": {"items": {"blog_id": {"$in": [1]}}}})
+    apply_update(doc, {"$inc": {"views": 2}})
+    apply_update(
+        doc,
+        {"$push": {"items": {"$each": [{"blog_id": 3, "n": 3}], "$sort": {"n": -1}, "$slice": 1}}},
+    )
+
+    assert doc == {"tags": ["a", "b"], "items": [{"blog_id": 3, "n": 3}], "views": 2}
+
+
+def test_find_sort_skip_limit_and_projection():
+    async def run():
+        blogs = MemoryCollection("blogs")
+        await blogs.create_index([("owner_id", 1), ("created_at", -1)])
+        for n in range(10):
+            await blogs.insert_one({"_id": n, "owner_id": str(n % 2), "created_at": n})
+
+        page = await blogs.find(
+            {"owner_id": "1"}, {"created_at": 1}, sort=[("created_at", -1)], skip=1, limit=2
+        )
+        assert page == [{"_id": 7, "created_at": 7}, {"_id": 5, "created_at": 5}]
+        assert await blogs.count_documents({"owner_id": {"$in": ["0", "1"]}}) == 10
+
+    asyncio.run(run())
+
+
+def test_unique_index_and_find_and_modify():
+    async def run():
+        users = MemoryCollection("users")
+        await users.create_index([("username", 1)], name="username_unique", unique=True)
+        user = {"username": "ann", "tags": []}
+        await users.insert_one(user)
+        assert "_id" in user
+
+        with pytest.raises(DuplicateKeyError):
+            await users.insert_one({"username": "ann"})
+        with pytest.raises(BulkWriteError) as e:
+            await users.insert_many([{"username": "bob"}, {"username": "ann"}], ordered=False)
+        assert [error["index"] for error in e.value.details["writeErrors"]] == [1]
+
+        after = await users.find_one_and_update(
+            {"_id": user["_id"]},
+            {"$addToSet": {"tags": {"$each": ["x"]}}},
+            projection={"tags": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        assert after == {"_id": user["_id"], "tags": ["x"]}
+        assert await users.find_one({"username": "bob"}) is not None
+
+    asyncio.run(run())
+
+
+def test_bulk_upsert_and_slice_projection():
+    async def run():
+        feeds = MemoryCollection("feeds")
+        await feeds.bulk_write(
+            [UpdateOne({"_id": "tag"}, {"$push": {"items": {"$each": [1, 2, 3]}}}, upsert=True)]
+        )
+        feed = await feeds.find_one({"_id": "tag"}, {"items": {"$slice": [1, 1]}})
+        assert feed == {"_id": "tag", "items": [2]}
+
+    asyncio.run(run())
@@ -0,0 +1,53 @@
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import metrics
+from metrics import CommandTimer, Histogram
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+    metrics.HISTOGRAMS.remove(histogram)
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+    assert 'test_seconds_sum{route="/a"} 5.55' in lines
+
+
+def test_label_values_are_escaped():
+    histogram = Histogram("test_escape", "Test.", ("route",), buckets=(1.0,))
+    metrics.HISTOGRAMS.remove(histogram)
+    histogram.observe(0.5, 'a"b')
+
+    assert 'test_escape_count{route="a\\"b"} 1' in histogram.render()
+
+
+def test_command_timer_labels_the_collection():
+    timer = CommandTimer()
+    started = SimpleNamespace(
+        command_name="find",
+        command={"find": "blogs", "filter": {}},
+        connection_id=("localhost", 27017),
+        request_id=1,
+    )
+    finished = SimpleNamespace(
+        command_name="find",
+        connection_id=("localhost", 27017),
+        request_id=1,
+        duration_micros=1500,
+    )
+    timer.started(started)
+    timer.succeeded(finished)
+
+    assert (
+        'mongo_command_duration_seconds_count{collection="blogs",command="find",outcome="success"} 1'
+        in metrics.mongo_command_duration.render()
+    )
@@ -0,0 +1,112 @@
+import asyncio
+import sys
+import os
+import pytest
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from fastapi import HTTPException
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pagination
+from database import blog_collection
+from fastapi import Response
+from pagination import NEXT_CURSOR_HEADER, created_range, cursor_filter, encode_cursor, paginate, sort_spec
+
+
+def test_sort_spec_adds_id_tiebreaker():
+    assert sort_spec("created_at", "desc") == [("created_at", -1), ("_id", -1)]
+    assert sort_spec("updated_at", "asc") == [("updated_at", 1), ("_id", 1)]
+
+
+def test_sort_spec_rejects_unindexed_field():
+    with pytest.raises(HTTPException) as e:
+        sort_spec("title", "desc")
+    assert e.value.status_code == 400
+
+
+def test_cursor_round_trip():
+    sort = sort_spec("created_at", "desc")
+    blog_id = ObjectId()
+    cursor = encode_cursor({"_id": blog_id, "created_at": "2024-03-20 11:58:02"}, sort)
+
+    assert cursor_filter(cursor, sort) == {
+        "$or": [
+            {"created_at": {"$lt": "2024-03-20 11:58:02"}},
+            {"created_at": "2024-03-20 11:58:02", "_id": {"$lt": blog_id}},
+        ]
+    }
+
+
+def test_cursor_from_other_sort_is_rejected():
+    cursor = encode_cursor({"_id": ObjectId(), "created_at": "x"}, sort_spec("created_at", "desc"))
+
+    with pytest.raises(HTTPException):
+        cursor_filter(cursor, sort_spec("created_at", "asc"))
+    with pytest.raises(HTTPException):
+        cursor_filter("not-a-cursor", sort_spec("created_at", "desc"))
+
+
+def test_cursor_round_trip_keeps_dates():
+    sort = sort_spec("created_at", "desc")
+    created_at = datetime(2024, 3, 20, 11, 58, 2, 123000, tzinfo=timezone.utc)
+    cursor = encode_cursor({"_id": ObjectId(), "created_at": created_at}, sort)
+
+    assert cursor_filter(cursor, sort)["$or"][0] == {"created_at": {"$lt": created_at}}
+
+
+def test_created_range_is_utc():
+    since = datetime(2024, 3, 20, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+    until = datetime(2024, 3, 21)
+
+    assert created_range() == {}
+    assert created_range(since, until) == {
+        "created_at": {
+            "$gte": datetime(2024, 3, 20, 10, 0, tzinfo=timezone.utc),
+            "$lt": datetime(2024, 3, 21, tzinfo=timezone.utc),
+        }
+    }
+
+
+def test_created_range_rejects_empty_range():
+    with pytest.raises(HTTPException) as e:
+        created_range(datetime(2024, 3, 21), datetime(2024, 3, 20))
+    assert e.value.status_code == 400
+
+
+def test_legacy_string_timestamps_are_paged_until_converted(monkeypatch):
+    monkeypatch.setattr(pagination, "_legacy", {"found": True, "checked_at": None})
+    day = lambda n: datetime(2024, 3, n, 12, tzinfo=timezone.utc)
+    legacy = pagination._legacy_string
+    blogs = [
+        {"_id": ObjectId(), "tags": ["legacy"], "created_at": day(21)},
+        {"_id": ObjectId(), "tags": ["legacy"], "created_at": day(19)},
+        {"_id": ObjectId(), "tags": ["legacy"], "created_at": legacy(day(20))},
+        {"_id": ObjectId(), "tags": ["legacy"], "created_at": legacy(day(18))},
+    ]
+
+    async def pages(query):
+        found, cursor = [], None
+        while True:
+            response = Response()
+            docs = await paginate(blog_collection, query, response, "created_at", "desc", 1, 1, cursor)
+            found += [doc["_id"] for doc in docs]
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if not cursor:
+                return found
+
+    async def run():
+        await blog_collection.insert_many(blogs)
+        ids = [blog["_id"] for blog in blogs]
+
+        # dates sort above strings, a cursor on a date goes on with the strings
+        assert await pages({"tags": "legacy"}) == ids
+        in_range = {"tags": "legacy", **created_range(day(19) + timedelta(hours=1), day(22))}
+        assert await pages(in_range) == [ids[0], ids[2]]
+
+        await blog_collection.delete_many({"_id": {"$in": ids[2:]}})
+        pagination._legacy["checked_at"] = None
+        assert not await pagination.legacy_timestamps(blog_collection)
+        assert await pages(in_range) == [ids[0]]
+        await blog_collection.delete_many({"_id": {"$in": ids}})
+
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+import asyncio
+import sys
+import os
+
+from bson import ObjectId
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import related
+from database import blog_collection, related_collection
+from migrations.rebuild_related import rebuild_related
+
+
+def test_rare_tags_weigh_more():
+    blog_id, popular, rare = ObjectId(), ObjectId(), ObjectId()
+    weights = {"python": related.tag_weight(100), "asyncio": related.tag_weight(2)}
+
+    items = related.top_related(
+        blog_id,
+        ["python", "asyncio"],
+        [(blog_id, {"python"}), (popular, {"python"}), (rare, {"asyncio"}), (ObjectId(), {"go"})],
+        weights,
+    )
+
+    assert [item["blog_id"] for item in items] == [rare, popular]
+
+
+def test_lists_are_maintained_incrementally():
+    async def run():
+        blogs = [
+            {"_id": ObjectId(), "tags": tags, "created_at": n}
+            for n, tags in enumerate([["a", "b"], ["a"], ["c"], ["a", "b"]])
+        ]
+        for blog in blogs:
+            await blog_collection.insert_one(blog)
+            await related.add_blog(blog)
+
+        assert await related.read_related(blogs[0]["_id"], 5) == [blogs[3]["_id"], blogs[1]["_id"]]
+        assert await related.read_related(blogs[2]["_id"], 5) == []
+
+        await blog_collection.delete_one({"_id": blogs[3]["_id"]})
+        await related.remove_blogs([blogs[3]["_id"]])
+        assert await related.read_related(blogs[0]["_id"], 5) == [blogs[1]["_id"]]
+        assert await related.read_related(ObjectId(), 5) is None
+
+        await related_collection.delete_many({})
+        await rebuild_related()
+        assert await related.read_related(blogs[1]["_id"], 5) == [blogs[0]["_id"]]
+
+        for blog in blogs:
+            await blog_collection.delete_one({"_id": blog["_id"]})
+        await related_collection.delete_many({})
+
+    asyncio.run(run())
+
+
+def test_bulk_inserted_blogs_are_added_together():
+    async def run():
+        old = {"_id": ObjectId(), "tags": ["a"], "created_at": 0}
+        await blog_collection.insert_one(old)
+        await related.add_blog(old)
+
+        batch = [
+            {"_id": ObjectId(), "tags": ["a", "b"], "created_at": 1},
+            {"_id": ObjectId(), "tags": ["b"], "created_at": 1},
+            {"_id": ObjectId(), "tags": [], "created_at": 1},
+        ]
+        await blog_collection.insert_many(batch)
+        await related.add_blogs(batch)
+
+        assert set(await related.read_related(batch[0]["_id"], 5)) == {old["_id"], batch[1]["_id"]}
+        assert await related.read_related(batch[1]["_id"], 5) == [batch[0]["_id"]]
+        assert await related.read_related(batch[2]["_id"], 5) == []
+        assert await related.read_related(old["_id"], 5) == [batch[0]["_id"]]
+
+        await blog_collection.delete_many({"_id": {"$in": [old["_id"]] + [blog["_id"] for blog in batch]}})
+        await related_collection.delete_many({})
+
+    asyncio.run(run())
@@ -0,0 +1,64 @@
+import sys
+import os
+from bson import ObjectId
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from search import InvertedIndex, tokenize
+
+
+def make_blog(title, body, tags, owner="alice"):
+    return {"_id": ObjectId(), "title": title, "body": body, "tags": tags, "owner_username": owner}
+
+
+def test_tokenize():
+    assert tokenize("AWS is a Cloud-platform!") == ["aws", "is", "cloud", "platform"]
+
+
+def test_title_matches_rank_first():
+    index = InvertedIndex()
+    in_body = make_blog("Cooking pasta", "cloud kitchens", ["food"])
+    in_title = make_blog("Cloud applications", "AWS is a cloud platform", ["tech"])
+    index.add(in_body)
+    index.add(in_title)
+
+    assert [blog_id for _, blog_id in index.search("cloud")] == [in_title["_id"], in_body["_id"]]
+
+
+def test_filters_and_keyset_pages():
+    index = InvertedIndex()
+    blogs = [make_blog(f"cloud {i}", "body", ["tech"], owner="bob" if i % 2 else "alice") for i in range(5)]
+    for blog in blogs:
+        index.add(blog)
+
+    assert {blog_id for _, blog_id in index.search("cloud", owner="bob")} == {blogs[1]["_id"], blogs[3]["_id"]}
+    assert index.search("cloud", tag="food") == []
+
+    first = index.search("cloud", limit=3)
+    second = index.search("cloud", limit=3, after=first[-1])
+    assert len(second) == 2
+    assert {r[1] for r in first + second} == {blog["_id"] for blog in blogs}
+
+
+def test_pages_are_stable_while_blogs_are_written():
+    index = InvertedIndex()
+    blogs = [make_blog("cloud " * (i + 1), "body", []) for i in range(4)]
+    for blog in blogs:
+        index.add(blog)
+
+    first = index.search("cloud", limit=2)
+    for i in range(20):
+        index.add(make_blog(f"other {i}", "body", []))
+    second = index.search("cloud", limit=2, after=first[-1])
+    assert [r[1] for r in first + second] == [blog["_id"] for blog in reversed(blogs)]
+
+
+def test_update_and_remove():
+    index = InvertedIndex()
+    blog = make_blog("cloud", "body", [])
+    index.add(blog)
+    index.add({**blog, "title": "kubernetes"})
+
+    assert index.search("cloud") == []
+    index.remove(blog["_id"])
+    assert index.search("kubernetes") == []
+    assert index.postings == {}
@@ -0,0 +1,66 @@
+import asyncio
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from fastapi import status
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import tag_stats
+from database import tag_stats_collection
+from main import app
+
+client = TestClient(app)
+TAGS = ["stats-a", "stats-b", "stats-c"]
+
+
+def _blog(tags, age_hours=0):
+    created_at = datetime.now(timezone.utc) - timedelta(hours=age_hours)
+    return {"_id": ObjectId(), "tags": tags, "created_at": created_at}
+
+
+def test_timestamp_accepts_dates_and_legacy_strings():
+    moment = datetime(2024, 3, 20, 11, 58, 2, tzinfo=timezone.utc)
+    assert tag_stats.timestamp(moment) == moment.timestamp()
+    assert tag_stats.timestamp(moment.replace(tzinfo=None)) == moment.timestamp()
+    assert tag_stats.timestamp("2024-03-20 11:58:02") == moment.timestamp()
+
+
+def test_counts_follow_blog_changes():
+    async def run():
+        first, second = _blog(["stats-a", "stats-b"]), _blog(["stats-a"])
+        await tag_stats.blogs_added([first, second])
+        await tag_stats.blog_updated(second, {**second, "tags": ["stats-c"]})
+        await tag_stats.blogs_removed([first])
+        await tag_stats.blogs_added([_blog(["stats-c"])])
+
+        counts = {item["tag"]: item["count"] for item in await tag_stats.tag_counts(100) if item["tag"] in TAGS}
+        assert counts == {"stats-c": 2}
+        await tag_stats_collection.delete_many({"_id": {"$in": TAGS}})
+
+    asyncio.run(run())
+
+
+def test_trending_scores_halve_every_half_life():
+    async def run():
+        half_life = tag_stats.TRENDING_HALF_LIFE_HOURS
+        await tag_stats.blogs_added([_blog(["stats-a"]), _blog(["stats-a"])])
+        await tag_stats.blogs_added([_blog(["stats-b"], age_hours=half_life) for _ in range(3)])
+        await tag_stats.blogs_added([_blog(["stats-c"], age_hours=2 * half_life) for _ in range(4)])
+
+        trending = [item for item in await tag_stats.trending_tags(100) if item["tag"] in TAGS]
+        assert [item["tag"] for item in trending] == ["stats-a", "stats-b", "stats-c"]
+        assert [round(item["score"], 2) for item in trending] == [2.0, 1.5, 1.0]
+        assert [item["count"] for item in trending] == [2, 3, 4]
+        await tag_stats_collection.delete_many({"_id": {"$in": TAGS}})
+
+    asyncio.run(run())
+
+
+def test_tag_routes_validate_limit():
+    for path in ("/api/dashboard/tags", "/api/dashboard/tags/trending"):
+        assert client.get(f"{path}?limit=5").status_code == status.HTTP_200_OK
+        for limit in (0, -1, 1000):
+            assert client.get(f"{path}?limit={limit}").status_code == status.HTTP_400_BAD_REQUEST
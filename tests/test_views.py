@@ -0,0 +1,70 @@
+import asyncio
+import sys
+import os
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import views
+from database import blog_collection
+from views import ViewCounter
+
+
+def test_views_are_written_behind():
+    blog_id = ObjectId()
+    asyncio.run(blog_collection.insert_one({"_id": blog_id, "title": "read me"}))
+    counter = ViewCounter(maxsize=10)
+
+    for _ in range(3):
+        counter.record(blog_id)
+    counter.record(ObjectId())
+    assert len(counter) == 2
+
+    assert asyncio.run(counter.flush()) == 2
+    assert len(counter) == 0
+    assert asyncio.run(blog_collection.find_one({"_id": blog_id}))["views"] == 3
+
+
+def test_buffer_is_bounded():
+    counter = ViewCounter(maxsize=2)
+    first, second = ObjectId(), ObjectId()
+
+    counter.record(first)
+    counter.record(second)
+    counter.record(ObjectId())
+    counter.record(first)
+
+    assert len(counter) == 2
+    assert counter.dropped == 1
+
+
+def test_failed_flush_keeps_counts(monkeypatch):
+    async def fail(*args, **kwargs):
+        raise RuntimeError("database down")
+
+    monkeypatch.setattr(views.blog_collection, "bulk_write", fail)
+    counter = ViewCounter(maxsize=10)
+    blog_id = ObjectId()
+    counter.record(blog_id)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(counter.flush())
+    assert counter._counts == {blog_id: 1}
+
+
+def test_partly_applied_flush_only_keeps_failed_counts(monkeypatch):
+    async def fail_second(requests, **kwargs):
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 14, "errmsg": "not a number"}]})
+
+    monkeypatch.setattr(views.blog_collection, "bulk_write", fail_second)
+    counter = ViewCounter(maxsize=10)
+    applied, failed = ObjectId(), ObjectId()
+    counter.record(applied)
+    counter.record(failed)
+    counter.record(failed)
+
+    with pytest.raises(BulkWriteError):
+        asyncio.run(counter.flush())
+    assert counter._counts == {failed: 2}
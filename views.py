@@ -0,0 +1,125 @@
+"""
+Write-behind view counters.
+
+read_blog records every read of a blog here instead of writing it to Mongo. The counts are summed
+per blog in memory and written every VIEW_FLUSH_SECONDS as one unordered bulk_write of $inc
+updates on the views field of the blogs, so a popular blog costs one update per flush however
+often it is read. The lifespan in main.py starts the flusher and drains the buffer on shutdown.
+
+The buffer holds at most VIEW_BUFFER_SIZE blogs. Reaching it triggers a flush right away, and
+while a flush is failing reads of blogs that are not buffered yet are dropped (and counted in
+dropped) rather than growing the buffer. Counts of a failed flush are put back and retried with
+the next one, only those of the failed updates when the bulk_write was partly applied. Counts
+still buffered when the process dies are lost, views are approximate.
+"""
+
+import asyncio
+import logging
+import os
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from database import blog_collection
+
+logger = logging.getLogger(__name__)
+
+VIEW_FLUSH_SECONDS = float(os.getenv("VIEW_FLUSH_SECONDS", "5"))
+VIEW_BUFFER_SIZE = int(os.getenv("VIEW_BUFFER_SIZE", "10000"))
+
+
+# ViewCounter buffers the view counts of this process, it is only touched from the event loop
+class ViewCounter:
+    def __init__(
+        self, maxsize: int = VIEW_BUFFER_SIZE, interval: float = VIEW_FLUSH_SECONDS
+    ):
+        self.maxsize = maxsize
+        self.interval = interval
+        self.dropped = 0
+        self._counts = {}
+        self._task = None
+        self._full = None
+
+    def __len__(self):
+        return len(self._counts)
+
+    # record will count one view of the blog
+    def record(self, blog_id):
+        if blog_id in self._counts:
+            self._counts[blog_id] += 1
+            return
+        if len(self._counts) >= self.maxsize:
+            self.dropped += 1
+            return
+
+        self._counts[blog_id] = 1
+        if len(self._counts) >= self.maxsize and self._full is not None:
+            self._full.set()
+
+    # flush will write the buffered counts with one unordered bulk_write and return the number of blogs
+    async def flush(self) -> int:
+        if not self._counts:
+            return 0
+
+        counts, self._counts = self._counts, {}
+        blog_ids = list(counts)
+        try:
+            await blog_collection.bulk_write(
+                [
+                    UpdateOne({"_id": blog_id}, {"$inc": {"views": counts[blog_id]}})
+                    for blog_id in blog_ids
+                ],
+                ordered=False,
+            )
+        except BulkWriteError as e:
+            # the other updates were applied, only the failed ones are put back
+            failed = {blog_ids[error["index"]] for error in e.details["writeErrors"]}
+            self._put_back({blog_id: counts[blog_id] for blog_id in failed})
+            raise
+        except Exception:
+            self._put_back(counts)
+            raise
+        return len(counts)
+
+    # _put_back will keep counts that were not written for the next flush and add the views recorded
+    # meanwhile, within maxsize
+    def _put_back(self, counts: dict):
+        for blog_id, count in self._counts.items():
+            if blog_id in counts or len(counts) < self.maxsize:
+                counts[blog_id] = counts.get(blog_id, 0) + count
+            else:
+                self.dropped += count
+        self._counts = counts
+
+    def start(self):
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    # stop will stop the periodic flushes and write what is still buffered
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Could not write %d buffered view counts", len(self))
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Could not write the view counts")
+                # a full buffer would otherwise retry right away
+                await asyncio.sleep(self.interval)
+
+
+view_counter = ViewCounter()